@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the TR configurator pipeline on synthetic trunked systems
+
+    python3 bench.py --save before.json
+    python3 bench.py --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import main
+
+# Band layouts, (low MHz, high MHz, channel raster KHz)
+BANDS = {
+    "vhf": [(150.8, 173.4, 7.5)],
+    "uhf": [(450.0, 470.0, 6.25)],
+    "700": [(769.0, 775.0, 6.25), (799.0, 805.0, 6.25)],
+    "800": [(851.0, 861.0, 12.5), (866.0, 869.0, 12.5)],
+}
+
+# name: (bands, channels, sites, systems)
+CASES = {
+    "vhf-small": (["vhf"], 5, 1, 1),
+    "uhf-medium": (["uhf"], 60, 4, 1),
+    "700-p25": (["700"], 150, 12, 1),
+    "800-county": (["800"], 400, 30, 2),
+    "700-800-statewide": (["700", "800"], 2000, 200, 8),
+    "mixed-statewide": (["vhf", "uhf", "700", "800"], 2000, 200, 12),
+}
+
+# Slower than this times the baseline is reported as a regression
+REGRESSION_RATIO = 1.25
+
+
+def generate_systems(seed, bands, channels, sites, systems):
+    """
+    Seeded RR shaped (getTrsDetails, getTrsSites) data for a set of systems
+
+    Systems take turns over the band layouts, the sites of a system sit in its
+    layout, each on a cluster of nearby channels with its first one or two
+    channels as control channels. Neighbouring sites reuse a few of each others
+    channels like real simulcast / adjacent sites, every other channel is new so
+    the systems add up to exactly channels distinct channels.
+    """
+    rng = random.Random(seed)
+    layouts = [layout for band in bands for layout in BANDS[band]]
+    capacity = sum(int((high - low) * 1000 / raster) + 1 for low, high, raster in layouts)
+    if not sites <= channels <= capacity:
+        raise ValueError(f"{channels} channels do not fit {sites} sites on the {capacity} channels of {', '.join(bands)}")
+
+    site_channels = [channels // sites + (1 if site < channels % sites else 0) for site in range(sites)]
+    used = set()
+    first_layout = rng.randrange(len(layouts))
+    generated = []
+    site_id = 10000
+    for system_index in range(systems):
+        system_sites = sites // systems + (1 if system_index < sites % systems else 0)
+        layout_index = (first_layout + system_index) % len(layouts)
+        low, high, raster = layouts[layout_index]
+        slots = int((high - low) * 1000 / raster)
+
+        rr_sites = []
+        for site_index in range(system_sites):
+            # Sites cluster within ~2 MHz so several share a SDR
+            cluster = rng.randint(0, max(0, slots - 1))
+            spread = int(2000 / raster)
+            freqs = set()
+            if rr_sites and rng.random() < 0.3:
+                freqs.update(rng.sample([freq["freq"] for freq in rr_sites[-1]["siteFreqs"]], 1))
+            wanted = site_channels[site_id - 10000]
+            added = 0
+            for _ in range(wanted * 20):
+                if added == wanted:
+                    break
+                slot = min(slots, max(0, cluster + rng.randint(-spread, spread)))
+                freq = f"{low + slot * raster / 1000:.5f}"
+                if freq not in used:
+                    used.add(freq)
+                    freqs.add(freq)
+                    added += 1
+            if added < wanted:
+                # The cluster is taken, fall back to the nearest free channels of the layout and then the others
+                nearest = sorted(
+                    (index != layout_index, abs(slot - cluster), f"{layout_low + slot * layout_raster / 1000:.5f}")
+                    for index, (layout_low, layout_high, layout_raster) in enumerate(layouts)
+                    for slot in range(int((layout_high - layout_low) * 1000 / layout_raster) + 1)
+                )
+                free = [freq for _, _, freq in nearest if freq not in used][:wanted - added]
+                used.update(free)
+                freqs.update(free)
+
+            freqs = sorted(freqs)
+            control = set(freqs[:rng.choice([1, 2])])
+            rr_sites.append({
+                "siteId": site_id,
+                "siteNumber": site_index + 1,
+                "siteModulation": rng.choice(["CPQSK", "FSK4"]),
+                "siteFreqs": [{"freq": freq, "use": "d" if freq in control else None} for freq in freqs],
+            })
+            site_id += 1
+
+        generated.append({"system_id": str(90000 + system_index), "details": {"sType": 8}, "sites": rr_sites})
+    return generated
+
+
+def time_stage(function, repeat):
+    """
+    Median wall time (ms) over repeat runs and the peak traced memory (KiB) of one run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"ms": round(statistics.median(timings), 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def run_case(name, seed, repeat, planners):
+    bands, channels, sites, systems = CASES[name]
+    generated = generate_systems(seed, bands, channels, sites, systems)
+    TR = main.tr_autotune()
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = main.rr_cache(cache_dir, offline=True)
+        for system in generated:
+            cache.put("getTrsDetails", (system["system_id"],), system["details"])
+            cache.put("getTrsSites", (system["system_id"],), system["sites"])
+        requested = [
+            {"system_id": system["system_id"], "sites": [str(site["siteId"]) for site in system["sites"]]}
+            for system in generated
+        ]
+        system_results, stages["fetch_cached"] = time_stage(
+            lambda: main.fetchSystemData(requested, False, None, None, True, cache),
+            repeat
+        )
+
+    channel_list = main.group_channels(system_results)
+    control_channels = {freq for system in system_results for site in system.sites for freq in site.control_channels}
+    half_spectrum_bandwidth = TR.up_convert(12.5, TR.multipliers.khz) / 2
+
+    plans = {}
+    for planner in planners:
+        plans[planner], stages[f"plan_{planner}"] = time_stage(lambda: TR.plan_channels(channel_list, 3.2, 12.5, planner), repeat)
+
+    radios = list(plans[planners[0]]["results"].values())
+
+    def select_centers():
+        channel_index = main.ChannelIndex(channel_list)
+        return [
+            TR.calculate_center(radio["low"], radio["high"] + half_spectrum_bandwidth, radio["sample_rate"], channel_index)
+            for radio in radios
+        ]
+    _, stages["center_selection"] = time_stage(select_centers, repeat)
+
+    _, stages["validation"] = time_stage(lambda: TR.verify_plan(plans[planners[0]]["results"], channel_list, half_spectrum_bandwidth, control_channels), repeat)
+
+    def serialize():
+        load = main.capacity_model().plan_load(plans[planners[0]], control_channels)
+        config = main.trunk_recorder_helper.config(
+            main.trunk_recorder_helper.build_systems(system_results),
+            main.trunk_recorder_helper.build_sources(plans[planners[0]], load)
+        )
+        return json.dumps(config, indent=4)
+    _, stages["serialization"] = time_stage(serialize, repeat)
+
+    return {
+        "channels": len(channel_list),
+        "sites": sum(len(system.sites) for system in system_results),
+        "plans": {
+            planner: {
+                "sdrs": len(plan["results"]),
+                "throughput": int(sum(radio["sample_rate"] for radio in plan["results"].values())),
+            }
+            for planner, plan in plans.items()
+        },
+        "stages": stages,
+    }
+
+
+def compare(results, baseline):
+    """
+    Print the before / after of every stage, returns True if any stage regressed
+    """
+    regressed = False
+    print(f"{'case':<18}{'stage':<18}{'before ms':>12}{'after ms':>12}{'ratio':>8}")
+    for name, case in results["cases"].items():
+        before_case = baseline["cases"].get(name)
+        if not before_case:
+            continue
+        for stage, after in case["stages"].items():
+            before = before_case["stages"].get(stage)
+            if not before:
+                continue
+            ratio = after["ms"] / before["ms"] if before["ms"] else 1.0
+            flag = ""
+            # Ignore noise on sub millisecond stages
+            if ratio > REGRESSION_RATIO and after["ms"] - before["ms"] > 1:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"{name:<18}{stage:<18}{before['ms']:>12.3f}{after['ms']:>12.3f}{ratio:>8.2f}{flag}")
+        for planner, plan in case["plans"].items():
+            before_plan = before_case["plans"].get(planner)
+            if before_plan and before_plan != plan:
+                print(f"{name:<18}{'plan_' + planner:<18} changed {before_plan} -> {plan}")
+    return regressed
+
+
+def startup():
+    parser = argparse.ArgumentParser(description='Benchmark the TR configurator on synthetic systems')
+    parser.add_argument('-c','--cases', nargs='+', help='Cases to run', choices=list(CASES), default=list(CASES))
+    parser.add_argument('-s','--seed', help='Seed for the system generator', type=int, default=1)
+    parser.add_argument('-n','--repeat', help='Runs per stage, the median is reported', type=int, default=5)
+    parser.add_argument('-pl','--planners', nargs='+', help='Planners to time', choices=main.PLANNERS, default=main.PLANNERS)
+    parser.add_argument('--save', help='Write the results to a JSON baseline')
+    parser.add_argument('--compare', help='Compare against a JSON baseline, exits 1 on a regression')
+    return parser.parse_args()
+
+
+def bench():
+    args = startup()
+    # The planners log every plan, keep the output to the report
+    logging.disable(logging.CRITICAL)
+
+    results = {"version": main.VERSION, "seed": args.seed, "cases": {}}
+    for name in args.cases:
+        results["cases"][name] = run_case(name, args.seed, args.repeat, args.planners)
+        case = results["cases"][name]
+        stages = "  ".join(f"{stage} {timing['ms']}ms/{timing['peak_kib']}KiB" for stage, timing in case["stages"].items())
+        print(f"[+] {name} - {case['channels']} channels, {case['sites']} sites - {stages}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"[+] Wrote baseline - {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline):
+            exit(1)
+
+
+if __name__ == "__main__":
+    bench()
@@ -1,14 +1,29 @@
 #!/usr/bin/python3
 
 import argparse
+import csv
 import datetime
+import hashlib
+import heapq
+import itertools
 import json
+import os
+import random
+import signal
+import subprocess
+import time
 import uuid
 import logging
 import decimal
-from copy import deepcopy
+import filecmp
+import math
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import NamedTuple
 
-from zeep import Client, helpers, exceptions
 
 VERSION = "v0.2.2-beta"
 
@@ -17,6 +32,90 @@ system_types = {
     8: "p25"
 }
 
+RR_WSDL = "http://api.radioreference.com/soap2/?wsdl&v=15&s=rpc"
+# How long (in seconds) the downloaded v15 WSDL is reused before fetching it again
+WSDL_TTL = 30 * 86400
+RR_APP_KEY = "4abd9b6f-bea7-11ec-ba68-0ecc8ab9ccec"
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tr_configurator")
+# How long (in seconds) a cached RR response is used before it is fetched again
+CACHE_TTLS = {
+    "getTrsDetails": 7 * 86400,
+    "getTrsSites": 86400,
+    "getTrsTalkgroups": 86400,
+    "getTrsTalkgroupCats": 86400,
+    "getTag": 30 * 86400,
+}
+# Concurrent getTag lookups when resolving talkgroup tags
+TAG_FETCH_WORKERS = 8
+# Most systems fetchSystemData fetches at once (one thread each), the rr_scheduler limits the calls in flight
+FETCH_WORKERS = 64
+# A talkgroup category whose calls keep failing through the RR retries is fetched again on its own this many times
+TALKGROUP_PARTITION_RETRIES = 2
+
+# Lowest sample rate (in HZ) we will run a SDR at
+SDR_MIN_SAMPLE_RATE = 900000
+# How close (in HZ) a channel may sit to a SDR's center before the DC spike hurts it
+DC_SPIKE_CLEARANCE = 10000
+
+# Ways tr_autotune can split channels between SDRs
+PLANNERS = ["greedy", "optimal"]
+# Rough trunk-recorder CPU cost in percent of one core, calibrate with --cpu_per_msps / --cpu_per_recorder
+CPU_PER_MSPS = 10.0
+CPU_PER_RECORDER = 5.0
+# Extra recorders on top of the busiest moment seen in a call log
+RECORDER_HEADROOM = 1.25
+
+# Msps one USB bus can carry when the --hosts inventory does not say (8 bit I/Q is 2 bytes a sample)
+USB_BUS_MAX_MSPS = 20.0
+
+# --site_subset tries every subset of up to this many optional sites, more are dropped one at a time
+SITE_SUBSET_EXACT = 10
+
+# --sdr_inventory plans exactly up to this many steps of its program (device combinations x channels x channels of
+# the widest window x kinds, about a second), above that windows are planned before they are placed on devices
+INVENTORY_EXACT_WORK = 4000000
+
+# Max sample rates (in MHz) tried by --sweep when none are given
+SDR_BANDWIDTH_OPTIONS = [1.024, 1.4, 1.8, 1.92, 2.048, 2.4, 2.56, 2.88, 3.2]
+
+# Kept in the output directory, hashes of what every config was generated from
+MANIFEST_NAME = "tr_configurator.manifest.json"
+
+# Radio Reference call scheduling: calls per second (and burst) allowed, seconds before a call times out,
+# retries of a transient failure, most calls in flight and how slow (seconds) a call may be before that is lowered
+RR_RATE = 10.0
+RR_BURST = 20
+RR_TIMEOUT = 30.0
+RR_RETRIES = 4
+RR_CONCURRENCY = 16
+RR_SLOW_CALL = 5.0
+# Retries wait a random time up to RR_BACKOFF * 2 ** attempt seconds, never over RR_BACKOFF_MAX
+RR_BACKOFF = 0.5
+RR_BACKOFF_MAX = 30.0
+
+# --watch polls each job every interval, give or take this fraction so jobs drift apart
+WATCH_JITTER = 0.1
+# Seconds a --reload_hook may run before it is killed
+RELOAD_HOOK_TIMEOUT = 300
+
+# Upper bounds (in ms) of the SOAP latency histogram buckets in a --profile report
+PROFILE_LATENCY_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Talkgroup export formats and their file extensions
+TALKGROUP_FORMATS = {"csv": "csv", "jsonl": "jsonl", "sqlite": "db"}
+TALKGROUP_CSV_HEADER = ["Decimal", "Hex", "Alpha Tag", "Mode", "Description", "Tag", "Category"]
+
+# Command line options a --jobs file may set per job
+JOB_OPTIONS = [
+    "system", "use_rr_site_id", "output_dir", "talkgroups", "talkgroup_formats", "talkgroup_partitions", "merge", "print", "print_radio_spacing", "random_file_name", "force",
+    "sdr_max_sample_rate", "sdr_fixed_sample_rate", "spectrum_bandwidth", "planner", "workers",
+    "max_recorders", "host_cpu", "cpu_per_msps", "cpu_per_recorder", "call_log", "recorder_headroom", "hosts",
+    "site_subset", "keep_sites", "sdr_inventory",
+]
+# Options of JOB_OPTIONS limited to the same choices as on the command line
+JOB_CHOICES = {"planner": PLANNERS, "talkgroup_formats": list(TALKGROUP_FORMATS)}
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, decimal.Decimal):
@@ -25,95 +124,806 @@ class DecimalEncoder(json.JSONEncoder):
             return o.isoformat()
         return super(DecimalEncoder, self).default(o)
 
+def plain_types(value, mappings=(dict,)):
+    """
+    A zeep result as the plain types json.loads(json.dumps(value, cls=DecimalEncoder)) gives back, in one pass without the round trip
+    """
+    if isinstance(value, mappings):
+        return {key: plain_types(value[key], mappings) for key in value}
+    if isinstance(value, (list, tuple)):
+        return [plain_types(item, mappings) for item in value]
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+class rr_cache:
+    """
+    On disk cache of Radio Reference responses, keyed by SOAP method and arguments
+    """
+    def __init__(self, cache_dir=CACHE_DIR, ttls=None, refresh=False, offline=False):
+        """
+        ttls overrides CACHE_TTLS per method, refresh ignores what is cached
+        and offline only ever answers from the cache (even if it is stale)
+        """
+        self.cache_dir = cache_dir
+        self.ttls = dict(CACHE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.refresh = refresh
+        self.offline = offline
+
+    def path(self, method, args):
+        key = hashlib.sha1(json.dumps([method, list(args)]).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{method}.{key}.json")
+
+    def get(self, method, args):
+        if self.refresh and not self.offline:
+            return None
+        try:
+            with open(self.path(method, args)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        age = time.time() - entry["fetched"]
+        if not self.offline and age > self.ttls.get(method, 0):
+            logging.debug(f"[-] Cached {method}{tuple(args)} is stale ({int(age)}s old)")
+            return None
+        logging.debug(f"[+] Using cached {method}{tuple(args)}")
+        return entry["result"]
+
+    def put(self, method, args, result):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(method, args)
+        # Write then rename so a killed run never leaves a half written entry, threads putting the same entry each get their own temp file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"method": method, "args": list(args), "fetched": time.time(), "result": result}, f)
+        os.replace(temp_path, path)
+
+
+class perf_profile:
+    """
+    Wall time per phase and call counts, latency and bytes received per SOAP method of a run
+
+    Phases timed on several threads at once add up, so they can sum to more
+    than the run took. A disabled profile records nothing
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.time()
+        self.phases = {}
+        self.soap = {}
+        self.gauges = {}
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        # Size of the last SOAP response each thread got, for its soap_call
+        self._local = threading.local()
+        self._clock = time.perf_counter()
+
+    def add(self, phase, seconds, calls=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.phases.setdefault(phase, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += calls
+            entry["seconds"] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def _method(self, method):
+        return self.soap.setdefault(method, {
+            "calls": 0, "errors": 0, "cache_hits": 0, "seconds": 0.0, "max_ms": 0.0, "bytes": 0,
+            "latency_ms": {str(bound): 0 for bound in PROFILE_LATENCY_BUCKETS + ["+Inf"]}
+        })
+
+    def gauge(self, name, value):
+        """
+        Keep the latest and highest / lowest values of name
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.gauges.setdefault(name, {"last": value, "min": value, "max": value})
+            entry["last"] = value
+            entry["min"] = min(entry["min"], value)
+            entry["max"] = max(entry["max"], value)
+
+    def cache_hit(self, method):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._method(method)["cache_hits"] += 1
+
+    def soap_call(self, method, seconds, error=False):
+        if not self.enabled:
+            return
+        received = getattr(self._local, "received", 0)
+        self._local.received = 0
+        ms = seconds * 1000
+        bucket = next((bound for bound in PROFILE_LATENCY_BUCKETS if ms <= bound), "+Inf")
+        with self._lock:
+            entry = self._method(method)
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["seconds"] += seconds
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            entry["bytes"] += received
+            entry["latency_ms"][str(bucket)] += 1
+
+    def received(self, content):
+        """
+        Count a response body, returns its size
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self.bytes_received += len(content)
+        return len(content)
+
+    def wrap_transport(self, transport):
+        """
+        Count the bytes of every document (the WSDL and its schemas) and SOAP response a zeep transport hands back
+        """
+        if not self.enabled:
+            return transport
+        load, post = transport.load, transport.post
+
+        def counted_load(url):
+            content = load(url)
+            self.received(content)
+            return content
+
+        def counted_post(address, message, headers):
+            response = post(address, message, headers)
+            self._local.received = self.received(response.content)
+            return response
+
+        transport.load, transport.post = counted_load, counted_post
+        return transport
+
+    def report(self):
+        soap = {}
+        for method, entry in self.soap.items():
+            soap[method] = dict(entry, seconds=round(entry["seconds"], 4), max_ms=round(entry["max_ms"], 1))
+            soap[method]["mean_ms"] = round(entry["seconds"] * 1000 / entry["calls"], 1) if entry["calls"] else 0.0
+        return {
+            "version": VERSION,
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(),
+            "wall_s": round(time.perf_counter() - self._clock, 4),
+            "phases": {phase: {"calls": entry["calls"], "seconds": round(entry["seconds"], 4)} for phase, entry in self.phases.items()},
+            "soap": soap,
+            "gauges": self.gauges,
+            "bytes_received": self.bytes_received,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+        logging.warning(f"[+] Wrote profile - {path}")
+
+
+# Shared by everything run without --profile
+NO_PROFILE = perf_profile(enabled=False)
+
+class RRFault(Exception):
+    """
+    Radio Reference answered with a SOAP fault (bad credentials, unknown system ...)
+    """
+
+
+class RRUnavailable(Exception):
+    """
+    A Radio Reference call kept failing (timeouts, dropped connections, 5xx) through every retry
+    """
+
+
+class rr_scheduler:
+    """
+    Runs every Radio Reference call of a run: a token bucket rate limit,
+    retries with jittered exponential backoff on transient failures and a
+    limit on calls in flight that adapts to the server
+
+    The limit grows by one per limit successful calls and halves (at most once
+    per RR_BACKOFF seconds) when a call fails transiently or takes longer than
+    slow_call, between one and concurrency
+    """
+    def __init__(self, rate=RR_RATE, burst=RR_BURST, timeout=RR_TIMEOUT, retries=RR_RETRIES, concurrency=RR_CONCURRENCY, slow_call=RR_SLOW_CALL, profile=None):
+        """
+        rate is calls per second (None for no limit), timeout is applied by rr_api to every call
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = max(1, concurrency)
+        self.slow_call = slow_call
+        self.profile = profile if profile else NO_PROFILE
+        self.limit = max(1.0, self.concurrency / 2)
+        self.inflight = 0
+        self.outcomes = {"ok": 0, "retried": 0, "failed": 0, "timeouts": 0, "throttled_s": 0.0}
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._decreased = 0.0
+        self._lock = threading.Lock()
+        self._slots = threading.Condition(self._lock)
+
+    def _throttle(self):
+        """
+        Take a token, sleeping until one is due. Tokens are reserved so waiting threads queue up in order
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.outcomes["throttled_s"] += wait
+        if wait:
+            time.sleep(wait)
+
+    def _acquire(self):
+        with self._slots:
+            while self.inflight >= int(self.limit):
+                self._slots.wait()
+            self.inflight += 1
+
+    def _release(self, healthy):
+        with self._slots:
+            self.inflight -= 1
+            now = time.monotonic()
+            if healthy:
+                self.limit = min(self.concurrency, self.limit + 1 / self.limit)
+            elif now - self._decreased > RR_BACKOFF and self.limit > 1:
+                self.limit = max(1.0, self.limit / 2)
+                self._decreased = now
+                logging.info(f"[-] Radio Reference is struggling, {int(self.limit)} calls at once from now")
+            self._slots.notify_all()
+        self.profile.gauge("rr_concurrency_limit", int(self.limit))
+
+    @staticmethod
+    def transient(error):
+        """
+        True for failures worth retrying: timeouts, dropped connections, 429 and 5xx answers without a SOAP fault
+        """
+        import requests
+        from zeep import exceptions
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)):
+            return True
+        if isinstance(error, exceptions.TransportError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    def run(self, method, args, call):
+        """
+        call() under the rate and concurrency limits, retried while it fails transiently
+        """
+        import requests
+        for attempt in range(self.retries + 1):
+            self._throttle()
+            self._acquire()
+            start = time.perf_counter()
+            try:
+                result = call()
+            except Exception as e:
+                seconds = time.perf_counter() - start
+                transient = self.transient(e)
+                self._release(not transient)
+                self.profile.soap_call(method, seconds, error=True)
+                if not transient:
+                    raise
+                timeout = isinstance(e, requests.exceptions.Timeout)
+                with self._lock:
+                    self.outcomes["timeouts"] += int(timeout)
+                    if attempt == self.retries:
+                        self.outcomes["failed"] += 1
+                    else:
+                        self.outcomes["retried"] += 1
+                if attempt == self.retries:
+                    logging.critical(f"[!] {method}{tuple(args)} failed {attempt + 1} times, giving up - {e}")
+                    raise RRUnavailable(f"{method}{tuple(args)} failed {attempt + 1} times - {e}") from e
+                backoff = random.uniform(0, min(RR_BACKOFF_MAX, RR_BACKOFF * 2 ** attempt))
+                logging.warning(f"[-] {method}{tuple(args)} {'timed out' if timeout else 'failed'}, retrying in {round(backoff, 2)}s - {e}")
+                time.sleep(backoff)
+                continue
+
+            seconds = time.perf_counter() - start
+            self._release(seconds <= self.slow_call)
+            self.profile.soap_call(method, seconds)
+            with self._lock:
+                self.outcomes["ok"] += 1
+            logging.debug(f"[+] {method}{tuple(args)} took {round(seconds, 3)}s")
+            return result
+
+    def summary(self):
+        return dict(self.outcomes, throttled_s=round(self.outcomes["throttled_s"], 3), limit=int(self.limit))
+
+
+class rr_api:
+    """
+    Radio Reference SOAP client shared by every RR instance (and thread) of a run
+    """
+    def __init__(self, username: str, password: str, pool_size: int = RR_CONCURRENCY, wsdl: str = RR_WSDL, cache_dir: str = None, record_dir: str = None, replay_dir: str = None, profile: perf_profile = None, scheduler: rr_scheduler = None):
+        """
+        wsdl may be a local copy of the v15 WSDL, otherwise the downloaded one
+        is kept in cache_dir so later runs can build the client without fetching it
+
+        record_dir saves every SOAP exchange as a fixture, replay_dir answers from saved fixtures instead of the API,
+        profile records every call made through this client and scheduler runs them (rate limits, timeouts and retries)
+        """
+        self.rr_user = username
+        self.rr_pass = password
+        self.pool_size = pool_size
+        self.wsdl = wsdl
+        self.cache_dir = cache_dir
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.profile = profile if profile else NO_PROFILE
+        self.scheduler = scheduler if scheduler else rr_scheduler(profile=self.profile)
+        self._client = None
+        self._auth_info = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """
+        Parse the WSDL once on first use, cached runs never touch the network
+        """
+        with self._lock:
+            if self._client is None:
+                start = time.perf_counter()
+                # zeep (and requests) take longer to import than most cached runs take, only load them when needed
+                import requests
+                from requests.adapters import HTTPAdapter
+                from zeep import Client, Transport
+                from zeep.cache import SqliteCache
+
+                # Keep-alive connections, sized so concurrent calls never wait on the pool
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                wsdl_cache = None
+                if self.cache_dir:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    wsdl_cache = SqliteCache(path=os.path.join(self.cache_dir, "wsdl.db"), timeout=WSDL_TTL)
+
+                timeouts = {"timeout": self.scheduler.timeout, "operation_timeout": self.scheduler.timeout}
+                if self.replay_dir:
+                    from rr_fixtures import ReplayTransport
+                    transport = ReplayTransport(self.replay_dir, session=session, **timeouts)
+                elif self.record_dir:
+                    from rr_fixtures import RecordingTransport
+                    transport = RecordingTransport(self.record_dir, session=session, cache=wsdl_cache, **timeouts)
+                else:
+                    transport = Transport(session=session, cache=wsdl_cache, **timeouts)
+                self.profile.wrap_transport(transport)
+
+                client = Client(self.wsdl, transport=transport)
+                # radio reference authentication
+                auth_type = client.get_type("ns0:authInfo")
+                self._auth_info = auth_type(
+                    username=self.rr_user,
+                    password=self.rr_pass,
+                    appKey=RR_APP_KEY,
+                    version="15",
+                    style="rpc",
+                )
+                self._client = client
+                self.profile.add("connect", time.perf_counter() - start)
+        return self._client, self._auth_info
+
+
+class Channel(NamedTuple):
+    """
+    One frequency of a site (HZ), control is True for control channels
+    """
+    freq: int
+    control: bool
+
+
+class Site(NamedTuple):
+    """
+    A site of a trunked system and its channels, in Radio Reference order
+    """
+    id: int
+    rr_site_id: int
+    modulation: str
+    channels: tuple
+
+    @classmethod
+    def from_rr(cls, site):
+        """
+        Site of a getTrsSites entry (a zeep object or its plain types), every frequency is converted once here
+        """
+        TR = tr_autotune()
+        return cls(
+            id=int(site["siteNumber"]),
+            rr_site_id=int(site["siteId"]),
+            modulation=site["siteModulation"],
+            channels=tuple(
+                Channel(int(TR.up_convert(float(freq["freq"]), TR.multipliers.mhz)), bool(freq["use"]))
+                for freq in site["siteFreqs"]
+            )
+        )
+
+    @property
+    def freqs(self):
+        return [channel.freq for channel in self.channels]
+
+    @property
+    def control_channels(self):
+        return [channel.freq for channel in self.channels if channel.control]
+
+
+class System(NamedTuple):
+    """
+    A trunked system and the sites of it that were asked for
+    """
+    system_id: str
+    system_type: int
+    sites: tuple
+
+    @property
+    def type(self):
+        return system_types[self.system_type]
+
+
+def group_channels(group):
+    """
+    Sorted channels (HZ) of every site of a group of Systems, a channel shared by several sites or systems only once
+    """
+    return sorted({freq for system in group for site in system.sites for freq in site.freqs})
+
+
 class RR:
     """
     Radio Refrence interface library
     """
-    def __init__(self, rr_system_id: str, username: str, password: str):
+    def __init__(self, rr_system_id: str, username: str, password: str, cache: rr_cache = None, tags: dict = None, api: rr_api = None):
         """
         Radio Refrence interface library
+
+        tags is a tagId -> description memo and api the SOAP client, share both between systems of the same run
         """
         self.rr_system_id = rr_system_id
         self.rr_user = username
         self.rr_pass = password
-    
+        self.cache = cache
+        self.tags = {} if tags is None else tags
+        self.api = api if api else rr_api(username, password)
 
-    def fetch_site_data(self, site_numbers, use_rr_id=True, add_metadata=False):
+    def _call(self, method, *args, result_type=None):
         """
-        Radio Refrence interface library
+        Call a RR SOAP method and return the result as plain json types
         """
-        # radio reference authentication
-        client = Client("http://api.radioreference.com/soap2/?wsdl&v=15&s=rpc")
-        auth_type = client.get_type("ns0:authInfo")
-        my_auth_info = auth_type(
-            username=self.rr_user,
-            password=self.rr_pass,
-            appKey="4abd9b6f-bea7-11ec-ba68-0ecc8ab9ccec",
-            version="15",
-            style="rpc",
-        )
+        if self.cache:
+            result = self.cache.get(method, args)
+            if result is not None:
+                self.api.profile.cache_hit(method)
+                return result
+            if self.cache.offline:
+                raise ValueError(f"No cached {method}{args} response, run once without '--offline' first")
+
+        client, auth_info = self.api.connect()
+        from zeep import exceptions
+        from zeep.xsd.valueobjects import CompoundValue
+        try:
+            result = self.api.scheduler.run(method, args, lambda: getattr(client.service, method)(*args, auth_info))
+        except exceptions.Fault as e:
+            raise RRFault(e.message) from e
+        if result_type:
+            result = client.get_type(result_type)(result)
+        result = plain_types(result, (dict, CompoundValue))
+
+        if self.cache:
+            self.cache.put(method, args, result)
+        return result
+
+    def fetch_tags(self, tag_ids):
+        """
+        Resolve tag descriptions, each distinct tag is only looked up once per run
+        """
+        missing = [tag_id for tag_id in set(tag_ids) if tag_id not in self.tags]
+        if missing:
+            with ThreadPoolExecutor(max_workers=TAG_FETCH_WORKERS) as pool:
+                for tag_id, tag in zip(missing, pool.map(lambda tag_id: self._call("getTag", tag_id), missing)):
+                    self.tags[tag_id] = tag[0]["tagDescr"]
+        return self.tags
+
+    @staticmethod
+    def talkgroup_rows(talkgroups, categories, tags):
+        """
+        Talkgroup rows of a getTrsTalkgroups result, generated one at a time
+        """
+        for talkgroup in talkgroups:
+            # Talkgroups without a known category are left out of the export
+            if talkgroup["tgCid"] not in categories:
+                continue
+            yield Talkgroup(
+                decimal=int(talkgroup["tgDec"]),
+                hex=format(int(talkgroup["tgDec"]), "x"),
+                alpha_tag=talkgroup["tgAlpha"],
+                mode=talkgroup["tgMode"].upper().replace("DE", "E"),
+                description=talkgroup["tgDescr"],
+                tag=tags[talkgroup["tags"][0]['tagId']] if talkgroup["tags"] else "",
+                category=categories[talkgroup["tgCid"]]
+            )
 
-        # prompt user for system ID
-        system = client.service.getTrsDetails(self.rr_system_id, my_auth_info)
+    def talkgroup_partitions(self, categories, workers):
+        """
+        Talkgroup rows fetched one category at a time, workers categories at once
 
+        Rows come out in category order as soon as every category before theirs
+        is in, only the categories that arrived early are held in memory. Each
+        category is cached on its own and one whose calls keep failing is fetched
+        again, up to TALKGROUP_PARTITION_RETRIES times, without the others
+        """
+        def fetch(category_id):
+            for attempt in range(TALKGROUP_PARTITION_RETRIES + 1):
+                try:
+                    talkgroups = self._call("getTrsTalkgroups", self.rr_system_id, category_id, 0, 0, result_type="ns0:Talkgroups")
+                    break
+                except RRUnavailable:
+                    if attempt == TALKGROUP_PARTITION_RETRIES:
+                        raise
+                    logging.warning(f"[-] Talkgroups of category {category_id} of {self.rr_system_id} failed, fetching them again")
+            tags = self.fetch_tags(talkgroup["tags"][0]['tagId'] for talkgroup in talkgroups if talkgroup["tags"])
+            return list(self.talkgroup_rows(talkgroups, categories, tags))
+
+        pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(categories))))
+        try:
+            partitions = [pool.submit(fetch, category_id) for category_id in categories]
+            for index in range(len(partitions)):
+                rows = partitions[index].result()
+                # Written rows are let go of
+                partitions[index] = None
+                yield from rows
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def fetch_site_data(self, site_numbers, use_rr_id=True, add_metadata=False, partitions=None):
+        """
+        Radio Refrence interface library
 
-        system_json = helpers.serialize_object(system, dict)
+        partitions fetches the talkgroups one category at a time, that many at once, instead of in one call
+        """
+        # prompt user for system ID
+        system = self._call("getTrsDetails", self.rr_system_id)
 
         # Read Talkgroup Data for given System ID
-        sites_type = client.get_type("ns0:TrsSites")
-        sites = sites_type(client.service.getTrsSites(self.rr_system_id, my_auth_info))
+        sites = self._call("getTrsSites", self.rr_system_id, result_type="ns0:TrsSites")
 
         if add_metadata:
-            talkgroups_type = client.get_type("ns0:Talkgroups")
-            talkgroups_result = talkgroups_type(
-                client.service.getTrsTalkgroups(self.rr_system_id, 0, 0, 0, my_auth_info)
-            )
-            talkgroups_result = helpers.serialize_object(talkgroups_result, dict)
-
-            talkgroup_cat = client.get_type("ns0:TalkgroupCats")
-            talkgroup_categories = talkgroup_cat(client.service.getTrsTalkgroupCats(self.rr_system_id, my_auth_info))
-            talkgroup_categories = json.loads(json.dumps(helpers.serialize_object(talkgroup_categories, dict), cls=DecimalEncoder))
-
-        if add_metadata:
-            logging.warning("[+] Fetching Radio Reference data, this will take a hot sec, so go airfry a hot-pocket or some pizza rolls")
-            talkgroups = []
-            for talkgroup in json.loads(json.dumps(talkgroups_result, cls=DecimalEncoder)):
-                for cat in talkgroup_categories:
-                    if cat["tgCid"] == talkgroup["tgCid"]:
-                        talkgroup["cat"] = cat["tgCname"]
-                        talkgroup["tag"] = ""
-                        if len(talkgroup["tags"]) > 0:
-                            tag_id = talkgroup["tags"][0]['tagId']
-                            tag = client.service.getTag(tag_id, my_auth_info)
-                            talkgroup["tag"] = tag[0]["tagDescr"]
-                        talkgroups.append(talkgroup)
+            if not partitions:
+                talkgroups_result = self._call("getTrsTalkgroups", self.rr_system_id, 0, 0, 0, result_type="ns0:Talkgroups")
+            talkgroup_categories = self._call("getTrsTalkgroupCats", self.rr_system_id, result_type="ns0:TalkgroupCats")
 
         results = {}
         results["sites"] = []
         if add_metadata:
-            results["talkgroups"] = talkgroups
-        results["system"] = json.loads(json.dumps(system_json, cls=DecimalEncoder))
+            logging.warning("[+] Fetching Radio Reference data, this will take a hot sec, so go airfry a hot-pocket or some pizza rolls")
+            categories = {cat["tgCid"]: cat["tgCname"] for cat in talkgroup_categories}
+            if partitions:
+                # Fetched while the rows are written
+                results["talkgroups"] = self.talkgroup_partitions(categories, partitions)
+            else:
+                with self.api.profile.phase("tags"):
+                    tags = self.fetch_tags(talkgroup["tags"][0]['tagId'] for talkgroup in talkgroups_result if talkgroup["tags"] and talkgroup["tgCid"] in categories)
+                results["talkgroups"] = self.talkgroup_rows(talkgroups_result, categories, tags)
+        results["system"] = system
 
         for site in sites:
             for site_number in site_numbers:
                 if use_rr_id:
                     if int(site_number) == int(site["siteId"]):
-                        _json = helpers.serialize_object(site, dict)
-                        results["sites"].append({ "site": site["siteNumber"], "rr_site_id": site["siteId"],  "data": json.loads(json.dumps(_json, cls=DecimalEncoder))})
+                        results["sites"].append(Site.from_rr(site))
                 else:
                     if int(site["siteNumber"]) == int(site_number):
-                        _json = helpers.serialize_object(site, dict)
-                        results["sites"].append({ "site": site["siteNumber"], "rr_site_id":  site["siteId"], "data": json.loads(json.dumps(_json, cls=DecimalEncoder))})
+                        results["sites"].append(Site.from_rr(site))
         if len(results["sites"]) == 0:
             raise ValueError("NO SITES RETURNED")
         return results
                 
+class Talkgroup(NamedTuple):
+    """
+    One row of a talkgroup export, in trunk-recorder talkgroupsFile column order
+    """
+    decimal: int
+    hex: str
+    alpha_tag: str
+    mode: str
+    description: str
+    tag: str
+    category: str
+
+
+class talkgroup_export:
+    """
+    Streams talkgroup rows into every requested format in a single pass
+
+    csv is the trunk-recorder talkgroupsFile, jsonl one object per row and
+    sqlite a table keyed (and indexed) for lookups. Each file is built next to
+    its target and only replaces it when its content changed
+    """
+    def __init__(self, basename, formats=("csv",)):
+        self.basename = basename
+        self.formats = list(formats)
+
+    def write(self, talkgroups):
+        """
+        Write an iterable of Talkgroup rows, returns the files that changed
+        """
+        paths = {format: f"{self.basename}.{TALKGROUP_FORMATS[format]}" for format in self.formats}
+        temp_paths = {format: f"{path}.{uuid.uuid4().hex}.tmp" for format, path in paths.items()}
+        files = []
+        db = None
+        writers = []
+        try:
+            if "csv" in paths:
+                csv_file = open(temp_paths["csv"], 'w', newline='')
+                files.append(csv_file)
+                csv_writer = csv.writer(csv_file, lineterminator="\n")
+                csv_writer.writerow(TALKGROUP_CSV_HEADER)
+                writers.append(csv_writer.writerow)
+            if "jsonl" in paths:
+                jsonl_file = open(temp_paths["jsonl"], 'w')
+                files.append(jsonl_file)
+                writers.append(lambda row: jsonl_file.write(json.dumps(row._asdict()) + "\n"))
+            if "sqlite" in paths:
+                db = sqlite3.connect(temp_paths["sqlite"])
+                db.execute(f"CREATE TABLE talkgroups ({', '.join(Talkgroup._fields)}, PRIMARY KEY (decimal))")
+                insert = f"INSERT OR REPLACE INTO talkgroups VALUES ({', '.join('?' * len(Talkgroup._fields))})"
+                writers.append(lambda row: db.execute(insert, row))
+
+            for row in talkgroups:
+                for write in writers:
+                    write(row)
+
+            if db:
+                db.execute("CREATE INDEX talkgroups_alpha_tag ON talkgroups (alpha_tag)")
+                db.execute("CREATE INDEX talkgroups_category ON talkgroups (category, tag)")
+                db.commit()
+        except BaseException:
+            for temp_path in temp_paths.values():
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        finally:
+            for f in files:
+                f.close()
+            if db:
+                db.close()
+
+        return [path for format, path in paths.items() if replace_if_changed(temp_paths[format], path)]
+
+
+class SdrWindow(NamedTuple):
+    """
+    The slice of spectrum one SDR covers, all values in HZ
+    """
+    low: int
+    high: int
+    center: int
+    sample_rate: float
+    freqs: tuple
+    # Distance from the center to the nearest channel, and from the outer channels to the passband edges
+    dc_margin: float
+    edge_margin: float
+    # The device of an sdr_inventory the window is planned on
+    sdr: dict = None
+
+    def as_result(self):
+        result = {
+            "freqs": list(self.freqs),
+            "high": self.high,
+            "low": self.low,
+            "channels": len(self.freqs),
+            "center": self.center,
+            "sample_rate": self.sample_rate,
+            "dc_margin": self.dc_margin,
+            "edge_margin": self.edge_margin
+        }
+        if self.sdr:
+            result["sdr"] = self.sdr
+        return result
+
+
+class CenterChoice(NamedTuple):
+    """
+    A SDR center (HZ) and the margins it leaves
+    """
+    center: int
+    dc_margin: float
+    edge_margin: float
+
+
+class ChannelIndex:
+    """
+    Sorted channels (HZ) and the ranges a SDR center can sit in without a channel on its DC spike
+    """
+    def __init__(self, freqs):
+        self.freqs = freqs
+        # Sorted, disjoint [clear_low, clear_high] ranges at least DC_SPIKE_CLEARANCE from every channel
+        self.clear_low = []
+        self.clear_high = []
+        edges = [-math.inf] + list(freqs) + [math.inf]
+        for below, above in zip(edges, edges[1:]):
+            if above - below >= 2 * DC_SPIKE_CLEARANCE:
+                self.clear_low.append(below + DC_SPIKE_CLEARANCE)
+                self.clear_high.append(above - DC_SPIKE_CLEARANCE)
+
+    def dc_margin(self, center):
+        """
+        Distance from center to the nearest channel
+        """
+        nearest = bisect_left(self.freqs, center)
+        return min(abs(center - freq) for freq in self.freqs[max(0, nearest - 1):nearest + 1])
+
+    def clear_center(self, target, lowest, highest):
+        """
+        The center between lowest and highest closest to target that is clear of every channel, or None
+        """
+        best = None
+        # Only the clear range holding (or just below) target and the next one up can be closest
+        gap = bisect_right(self.clear_low, target) - 1
+        for candidate in (gap, gap + 1):
+            if not 0 <= candidate < len(self.clear_low):
+                continue
+            low = max(self.clear_low[candidate], lowest)
+            high = min(self.clear_high[candidate], highest)
+            if low <= high:
+                center = min(max(target, low), high)
+                if best is None or abs(center - target) < abs(best - target):
+                    best = center
+        return best
+
+    def widest_gap_center(self, lowest, highest):
+        """
+        The center between lowest and highest furthest from any channel
+        """
+        first = bisect_left(self.freqs, lowest)
+        last = bisect_right(self.freqs, highest)
+        points = [lowest] + list(self.freqs[first:last]) + [highest]
+        candidates = [lowest, highest] + [(below + above) // 2 for below, above in zip(points, points[1:])]
+        return max(candidates, key=self.dc_margin)
+
+
+class PlanProblem(NamedTuple):
+    """
+    Something wrong with one channel (HZ) of a plan, radio is the radio index it concerns (None if no radio)
+
+    problem is "unassigned" (no radio lists it), "split" (several radios list it), "uncovered"
+    or "control_uncovered" (no source's usable passband holds it) or "dc_spike" (it sits within
+    DC_SPIKE_CLEARANCE of the center of the source that receives it)
+    """
+    freq: int
+    radio: int
+    problem: str
+
+
 class tr_autotune:
     # Ya ya... I dont want to always redo the math :|
     class multipliers:
         khz = 1000
         mhz = 1e+6
 
+    def __init__(self, profile=None):
+        """
+        profile (a perf_profile) times every plan
+        """
+        self.profile = profile if profile else NO_PROFILE
+
     def down_convert(self, value, multiplier):
         return (value / multiplier).__round__(4)
 
@@ -127,49 +937,132 @@ class tr_autotune:
             new_freqs.append(int(self.up_convert(freq, self.multipliers.mhz)))
         return new_freqs
 
-    def validate_coverage(self, radio_list, freq_list):
-        results = []
-        all_freq_covered = True
-        
-        for radio in range(1, len(radio_list) + 1):
-            covered = False
-            for freq in radio_list[radio]["freqs"]:
-                if radio_list[radio]["low"]  <= freq <= radio_list[radio]["high"]:
-                    covered = True
-            results.append({"freq": freq, "covered": covered})
+    def verify_plan(self, radio_list, freq_list, half_spectrum_bandwidth, control_channels=(), sample_rate=None):
+        """
+        PlanProblems of a find_freqs "results" for the channels (HZ) of freq_list, an empty list for a sound plan
+
+        Every channel must be listed by exactly one radio and fall inside a usable
+        passband (center +- sample_rate (or an inventory SDR's usable bandwidth) / 2, less half_spectrum_bandwidth at either
+        edge), every control channel too. Like trunk-recorder, the first source whose
+        passband holds a channel receives it and that source's DC spike must be clear
+        of it. sample_rate (HZ) overrides the planned rates, as --sdr_fixed_sample_rate
+        does. One sweep over the sorted channels and passbands, O(n log n)
+        """
+        problems = []
+        assigned = {}
+        for radio_index, radio in radio_list.items():
+            for freq in set(radio["freqs"]):
+                if freq in assigned:
+                    problems.append(PlanProblem(freq, radio_index, "split"))
+                assigned.setdefault(freq, radio_index)
+
+        channels = set(freq_list)
+        problems += [PlanProblem(freq, None, "unassigned") for freq in sorted(channels) if freq not in assigned]
+
+        # (low, high, order, radio index, center) of every usable passband, by low edge
+        passbands = []
+        for order, (radio_index, radio) in enumerate(radio_list.items()):
+            # Inventory SDRs only pass part of their rate
+            half_sample_rate = (sample_rate or (radio["sdr"]["usable_bandwidth"] if "sdr" in radio else radio["sample_rate"])) / 2
+            passbands.append((
+                radio["center"] - half_sample_rate + half_spectrum_bandwidth,
+                radio["center"] + half_sample_rate - half_spectrum_bandwidth,
+                order,
+                radio_index,
+                radio["center"]
+            ))
+        passbands.sort()
+
+        # Passbands opened below the channel, the one trunk-recorder would pick on top
+        opened = []
+        next_passband = 0
+        for freq in sorted(channels | set(control_channels)):
+            while next_passband < len(passbands) and passbands[next_passband][0] <= freq:
+                low, high, order, radio_index, center = passbands[next_passband]
+                heapq.heappush(opened, (order, high, radio_index, center))
+                next_passband += 1
+            # Channels only go up, a passband that ends below this one is done for good
+            while opened and opened[0][1] < freq:
+                heapq.heappop(opened)
+            if not opened:
+                problems.append(PlanProblem(freq, None, "control_uncovered" if freq in control_channels else "uncovered"))
+                continue
+            _, _, radio_index, center = opened[0]
+            if abs(freq - center) < DC_SPIKE_CLEARANCE:
+                problems.append(PlanProblem(freq, radio_index, "dc_spike"))
+        return problems
+
+    def check_plan(self, problems, channels):
+        """
+        Raise a ValueError on a verify_plan problem besides DC spikes, which are only logged
+        """
+        failures = [problem for problem in problems if problem.problem != "dc_spike"]
+        if failures:
+            details = ", ".join(f"{self.down_convert(problem.freq, self.multipliers.mhz)} {problem.problem}" for problem in failures[:10])
+            raise ValueError(f"Not all frequencies are covered! {len(failures)} problems - {details}")
 
-        for result in results:
-            if not result["covered"]:
-                all_freq_covered = False
+        for problem in problems:
+            logging.warning(f"[-] Radio {problem.radio} receives {self.down_convert(problem.freq, self.multipliers.mhz)} within {DC_SPIKE_CLEARANCE}HZ of its center")
 
-        if not all_freq_covered:
-            raise ValueError("Not all frequencies are covered!")
+        logging.warning(f"[+] Validated all {str(channels)} channels are covered")
 
-        logging.warning(f"[+] Validated all {str(len(freq_list))} channels are covered")
+    def calculate_center(self, lower_edge, upper_edge, sample_rate, channel_index):
+        """
+        Pick the center of a SDR whose channels span lower_edge..upper_edge (HZ)
 
-                
-    def calculate_center(self, lower_freq, upper_freq, system_freqs):
-        center = (lower_freq + upper_freq)/2
+        Keeps the midpoint when it is clear of the DC spike, otherwise moves to the
+        closest center that is, otherwise to the middle of the widest channel free
+        gap. The center never moves far enough to push a channel out of the passband.
+        """
+        half_sample_rate = sample_rate / 2
+        # Every center in lowest..highest keeps the channels inside the passband
+        lowest = math.ceil(upper_edge - half_sample_rate)
+        highest = math.floor(lower_edge + half_sample_rate)
+        target = min(max(int((lower_edge + upper_edge) / 2), lowest), highest)
+
+        center = channel_index.clear_center(target, lowest, highest)
+        if center is None:
+            center = channel_index.widest_gap_center(lowest, highest)
+        center = int(center)
 
-        rounding_change = 10000.0 # in HZ
-        bad_center = False
-        for freq in system_freqs:            
-            freq_rounded = self.up_convert(freq, self.multipliers.mhz)
-            # Check if our center freq is too close
-            if freq_rounded - rounding_change <= center <= freq_rounded + rounding_change:
-                bad_center = True
+        edge_margin = min(lower_edge - (center - half_sample_rate), (center + half_sample_rate) - upper_edge)
+        return CenterChoice(center, channel_index.dc_margin(center), edge_margin)
 
-        if bad_center:
-            center = center + rounding_change
+    def build_window(self, lower_freq, radio_freqs, half_spectrum_bandwidth, channel_index, sample_rate=None, sdr=None):
+        """
+        SdrWindow opening at lower_freq and covering the sorted radio_freqs
 
-        return center
+        sample_rate and sdr are set for windows on a device of an sdr_inventory, the
+        center then keeps the channels inside the sdr's usable bandwidth
+        """
+        radio_high_freq = radio_freqs[-1]
+        if sample_rate is None:
+            sample_rate = self.sample_rate(lower_freq, radio_high_freq, half_spectrum_bandwidth)
+        bandwidth = sdr["usable_bandwidth"] if sdr else sample_rate
+        center = self.calculate_center(lower_freq, radio_high_freq + half_spectrum_bandwidth, bandwidth, channel_index)
+        return SdrWindow(
+            low=lower_freq,
+            high=radio_high_freq,
+            center=center.center,
+            sample_rate=sample_rate,
+            freqs=tuple(radio_freqs),
+            dc_margin=center.dc_margin,
+            edge_margin=center.edge_margin,
+            sdr=sdr
+        )
     ########################################################################
 
 
-    def find_freqs(self, SYSTEM_FREQ_LIST, MAX_SDR_BANDWIDTH=3.2, SPECTRUM_BANDWIDTH=12.5):
+    def find_freqs(self, SYSTEM_FREQ_LIST, MAX_SDR_BANDWIDTH=3.2, SPECTRUM_BANDWIDTH=12.5, PLANNER="greedy"):
         # sort our freqs low to high
-        SYSTEM_FREQS = self.clean_frequencies(SYSTEM_FREQ_LIST)
+        return self.plan_channels(self.clean_frequencies(SYSTEM_FREQ_LIST), MAX_SDR_BANDWIDTH, SPECTRUM_BANDWIDTH, PLANNER)
 
+    def plan_channels(self, SYSTEM_FREQS, MAX_SDR_BANDWIDTH=3.2, SPECTRUM_BANDWIDTH=12.5, PLANNER="greedy", INVENTORY=None):
+        """
+        find_freqs for channels already sorted and in HZ, like group_channels gives
+
+        With an sdr_inventory the windows go on its devices instead (MAX_SDR_BANDWIDTH and PLANNER are not used)
+        """
         # Get our bandwith's
         # sdr_bandwidth = self.up_convert(SDR_BANDWIDTH, self.multipliers.mhz)
         spectrum_bandwidth = self.up_convert(float(SPECTRUM_BANDWIDTH), self.multipliers.khz)
@@ -203,106 +1096,434 @@ class tr_autotune:
         logging.info(f"[+] Total bandwidth to cover - {self.down_convert(total_coverage_bandwidth, self.multipliers.mhz)}")
             #logging.warning(f"[+] Total Leftover SDR bandwidth - {self.down_convert(leftover_bandwith, self.multipliers.mhz)}")
     
-        # if SDR_BANDWIDTH:
-        radios = self.do_a_math(SYSTEM_FREQS, half_spectrum_bandwidth, lower_edge, self.up_convert(float(MAX_SDR_BANDWIDTH), self.multipliers.mhz))
+        with self.profile.phase("plan_inventory" if INVENTORY else f"plan_{PLANNER}"):
+            radios = self.do_a_math(SYSTEM_FREQS, half_spectrum_bandwidth, lower_edge, self.up_convert(float(MAX_SDR_BANDWIDTH), self.multipliers.mhz), PLANNER, INVENTORY)
         
         logging.info(f"[+] Total Radios Needed - {str(len(radios))}")
+        if INVENTORY:
+            return {"bandwidth": INVENTORY.bandwidth(INVENTORY.kinds[0]), "results": radios}
         return {"bandwidth": self.up_convert(MAX_SDR_BANDWIDTH, self.multipliers.mhz), "results": radios}
-        # else:           
-        #     logging.warning("[+] Tring to find the right SDR bandwidth") 
-        #     results = []
-        #     for sdr_bandwidth_option in SDR_BANDWIDTH_OPTIONS:
-        #         radios = self.do_a_math(SYSTEM_FREQS, half_spectrum_bandwidth, lower_edge, self.up_convert(sdr_bandwidth_option, self.multipliers.mhz))
-        #         results.append({"bandwidth": sdr_bandwidth_option, "results": radios})
-
-        #     lowest_radio_count = 1e6
-        #     final_result = None
-        #     sorted_results = sorted(results, key=lambda item: item["bandwidth"], reverse=True)
-        #     for result in sorted_results:
-        #         if len(result["results"]) <= lowest_radio_count:
-        #             if debug:
-        #                 logging.warning(f"[+] Found new best SDR Bandwidth - {self.up_convert(result['bandwidth'], self.multipliers.mhz)} - {len(result['results'])}") 
-        #             lowest_radio_count = len(radios)
-        #             final_result = result
-        #     return final_result
-
-
-
-    def do_a_math(self, SYSTEM_FREQS, half_spectrum_bandwidth, lower_edge, sdr_bandwidth):
-        
-        radio_high_freq, indexed_channels, radio_index = 0, 0, 1
-        # System Channel count minux one for zero index
-        channels = len(SYSTEM_FREQS) 
 
-        # Dict to hold our results
-        radio_matrixes = {}
+    def sweep(self, SYSTEM_FREQ_LIST, SDR_BANDWIDTHS=SDR_BANDWIDTH_OPTIONS, SPECTRUM_BANDWIDTHS=(12.5,)):
+        """
+        sweep_channels over frequencies in MHz
+        """
+        return self.sweep_channels(self.clean_frequencies(SYSTEM_FREQ_LIST), SDR_BANDWIDTHS, SPECTRUM_BANDWIDTHS)
+
+    def sweep_channels(self, SYSTEM_FREQS, SDR_BANDWIDTHS=SDR_BANDWIDTH_OPTIONS, SPECTRUM_BANDWIDTHS=(12.5,)):
+        """
+        Plan every (max sample rate MHz, spectrum bandwidth KHz) pair at once and return the Pareto front
+
+        Runs the greedy planner for the whole grid in lock step with numpy, one
+        window per iteration for every pair still planning. Centers are picked
+        like calculate_center, falling back to the widest gap one window at a
+        time, so a pair's worst edge margin is the one of the plan find_freqs
+        builds for it. A pair is on the front when no other pair needs fewer or
+        equal SDRs and I/Q throughput with at least the same worst edge margin
+        (and is better in one of them).
+        """
+        import numpy as np
+
+        channel_index = ChannelIndex(list(SYSTEM_FREQS))
+        SYSTEM_FREQS = np.array(SYSTEM_FREQS, dtype=np.float64)
+        clear_low = np.array(channel_index.clear_low, dtype=np.float64)
+        clear_high = np.array(channel_index.clear_high, dtype=np.float64)
+
+        sdr_grid, spectrum_grid = np.meshgrid(
+            np.array([self.up_convert(float(rate), self.multipliers.mhz) for rate in SDR_BANDWIDTHS]),
+            np.array([self.up_convert(float(bandwidth), self.multipliers.khz) for bandwidth in SPECTRUM_BANDWIDTHS]),
+            indexing="ij"
+        )
+        sdr_bandwidth = sdr_grid.ravel()
+        half_spectrum_bandwidth = spectrum_grid.ravel() / 2
+
+        points = len(sdr_bandwidth)
+        indexed_channels = np.zeros(points, dtype=np.int64)
+        radios = np.zeros(points, dtype=np.int64)
+        throughput = np.zeros(points)
+        edge_margin = np.full(points, np.inf)
+        dc_hits = np.zeros(points, dtype=np.int64)
+
+        active = np.arange(points)
+        while len(active):
+            half = half_spectrum_bandwidth[active]
+            # Same window rules as plan_windows
+            lower_freq = np.trunc(SYSTEM_FREQS[indexed_channels[active]] - half)
+            max_sdr_useable_freq = np.trunc(lower_freq + half + sdr_bandwidth[active])
+            # Open on the first unassigned channel like plan_windows
+            first = indexed_channels[active]
+            last = np.searchsorted(SYSTEM_FREQS, max_sdr_useable_freq, side="left")
+            radio_high_freq = SYSTEM_FREQS[last - 1]
+
+            sample_rate = np.maximum((radio_high_freq - lower_freq) + half * 2, SDR_MIN_SAMPLE_RATE)
+            sample_rate += -sample_rate % 8
+
+            # Vectorised ChannelIndex.clear_center over the centers that keep the channels in the passband
+            upper_edge = radio_high_freq + half
+            lowest = np.ceil(upper_edge - sample_rate / 2)
+            highest = np.floor(lower_freq + sample_rate / 2)
+            target = np.clip(np.trunc((lower_freq + upper_edge) / 2), lowest, highest)
+            center = target.copy()
+            distance = np.full(len(active), np.inf)
+            gap = np.searchsorted(clear_low, target, side="right") - 1
+            for candidate in (gap, gap + 1):
+                valid = (candidate >= 0) & (candidate < len(clear_low))
+                candidate = np.clip(candidate, 0, max(len(clear_low) - 1, 0))
+                if not len(clear_low):
+                    break
+                low = np.maximum(clear_low[candidate], lowest)
+                high = np.minimum(clear_high[candidate], highest)
+                clamped = np.clip(target, low, high)
+                better = valid & (low <= high) & (np.abs(clamped - target) < distance)
+                center = np.where(better, clamped, center)
+                distance = np.where(better, np.abs(clamped - target), distance)
+
+            # No clear center, fall back to the widest gap like calculate_center (few windows, one at a time)
+            hit = np.isinf(distance)
+            for window in np.flatnonzero(hit):
+                center[window] = channel_index.widest_gap_center(lowest[window], highest[window])
+            center = np.trunc(center)
+
+            radios[active] += 1
+            throughput[active] += sample_rate
+            dc_hits[active] += hit
+            margin = np.minimum(lower_freq - (center - sample_rate / 2), (center + sample_rate / 2) - upper_edge)
+            edge_margin[active] = np.minimum(edge_margin[active], margin)
+
+            indexed_channels[active] += last - first
+            active = active[indexed_channels[active] < len(SYSTEM_FREQS)]
+
+        # A pair is dominated if another is no worse on all three and better on one
+        no_worse = (
+            (radios[:, None] <= radios[None, :])
+            & (throughput[:, None] <= throughput[None, :])
+            & (edge_margin[:, None] >= edge_margin[None, :])
+        )
+        better = (
+            (radios[:, None] < radios[None, :])
+            | (throughput[:, None] < throughput[None, :])
+            | (edge_margin[:, None] > edge_margin[None, :])
+        )
+        dominated = (no_worse & better).any(axis=0)
+
+        grid = []
+        for point in range(points):
+            grid.append({
+                "sdr_max_sample_rate": self.down_convert(float(sdr_bandwidth[point]), self.multipliers.mhz),
+                "spectrum_bandwidth": self.down_convert(float(half_spectrum_bandwidth[point] * 2), self.multipliers.khz),
+                "sdrs": int(radios[point]),
+                "throughput": int(throughput[point]),
+                "edge_margin": float(edge_margin[point]),
+                "dc_hits": int(dc_hits[point]),
+                "pareto": not bool(dominated[point])
+            })
+        pareto = sorted((point for point in grid if point["pareto"]), key=lambda point: (point["sdrs"], point["throughput"]))
+        logging.info(f"[+] Swept {points} sample rate / bandwidth pairs, {len(pareto)} on the Pareto front")
+        return {"channels": len(SYSTEM_FREQS), "pareto": pareto, "grid": grid}
+
+    def sample_rate(self, lower_freq, upper_freq, half_spectrum_bandwidth):
+        """
+        Sample rate needed to cover lower_freq..upper_freq, at least SDR_MIN_SAMPLE_RATE and divisable by eight
+        """
+        radio_sample_range = (upper_freq - lower_freq) + (half_spectrum_bandwidth * 2)
+        radio_sample_range += max(0, SDR_MIN_SAMPLE_RATE - radio_sample_range)
+        return radio_sample_range + (-radio_sample_range % 8)
+
+    def plan_windows(self, SYSTEM_FREQS, half_spectrum_bandwidth, lower_edge, sdr_bandwidth, channel_index):
+        """
+        Split the sorted channels into SDR windows in a single pass
+
+        Each window opens on the first channel not yet assigned and takes every
+        channel up to sdr_bandwidth above it, found with a binary search.
+        """
+        windows = []
+        channels = len(SYSTEM_FREQS)
+        indexed_channels = 0
 
         # First system Freq minus half the spectrum BW
         lower_freq = int(SYSTEM_FREQS[0] - half_spectrum_bandwidth)
         # End of the useable radio range accounting for the half_spectrum_bandwidth
         max_sdr_useable_freq = int((lower_edge + half_spectrum_bandwidth) + sdr_bandwidth)
 
-        # While loop to track if we have indexed all channels to radios
-        while (indexed_channels < channels):
-
-            # Channel Count
-            sdr_channel_count = 0
-            # Check if frquencies are near each other and assign to radios
-            for freq in SYSTEM_FREQS:
-                # If our frequency is within the bandwidth tolerance of the SDR
-                if (freq > lower_freq) and (freq < max_sdr_useable_freq):
-                    # Checks if we have created the radio in the results dict yet (Avoids a key error)
-                    if not radio_index in radio_matrixes:
-                        radio_matrixes[radio_index] = {}
-                        radio_matrixes[radio_index]["freqs"] = []
+        while indexed_channels < channels:
+            # Every channel not yet assigned strictly inside the radio's range, a search on lower_freq
+            # would pick up assigned channels within half a spectrum bandwidth below the opening one
+            last = bisect_left(SYSTEM_FREQS, max_sdr_useable_freq, indexed_channels)
+            radio_freqs = SYSTEM_FREQS[indexed_channels:last]
+            indexed_channels += len(radio_freqs)
+            windows.append(self.build_window(lower_freq, radio_freqs, half_spectrum_bandwidth, channel_index))
 
-                    # Add matched frerquency to our radio's list
-                    radio_matrixes[radio_index]["freqs"].append(freq)
-                    # set last indexed Freq to our loops value
-                    radio_high_freq = freq
+            # Check we havent reacherd the end of our channels
+            if indexed_channels < channels:
+                # Set to the next freq in the list minus half the spectrum BW
+                lower_freq = int(SYSTEM_FREQS[indexed_channels] - half_spectrum_bandwidth)
+                # Set to the max sdr reciveable bandwidth from the lower_freq
+                max_sdr_useable_freq = int((lower_freq + half_spectrum_bandwidth) + sdr_bandwidth)
+        return windows
 
-                    # Increment our tracker counts for radio channels / Channels accounted for
-                    sdr_channel_count += 1
-                    indexed_channels += 1            
+    def plan_optimal(self, SYSTEM_FREQS, half_spectrum_bandwidth, sdr_bandwidth, channel_index):
+        """
+        Split the sorted channels into the fewest SDR windows, then the lowest total sample rate
+
+        Dynamic program over the cut points of the sorted list, best[j] is the
+        cheapest way to cover the first j channels as a (radios, total sample
+        rate, windows with a channel on the DC spike) tuple, so DC spikes only
+        break ties. A window may span the
+        same sdr_bandwidth the greedy planner allows, so this never needs more
+        radios than it does.
+        """
+        channels = len(SYSTEM_FREQS)
+        best = [None] * (channels + 1)
+        best[0] = (0, 0, 0)
+        window_start = [0] * (channels + 1)
+
+        for end in range(1, channels + 1):
+            # Never split a repeated channel between two radios
+            if end < channels and SYSTEM_FREQS[end] == SYSTEM_FREQS[end - 1]:
+                continue
+
+            radio_high_freq = SYSTEM_FREQS[end - 1]
+            # Windows ending on radio_high_freq can only open on channels within sdr_bandwidth of it
+            for start in range(bisect_right(SYSTEM_FREQS, radio_high_freq - sdr_bandwidth), end):
+                if best[start] is None:
+                    continue
+                lower_freq = int(SYSTEM_FREQS[start] - half_spectrum_bandwidth)
+                sample_rate = self.sample_rate(lower_freq, radio_high_freq, half_spectrum_bandwidth)
+                # Same center range calculate_center searches, only whether a clear center exists matters here
+                half_sample_rate = sample_rate / 2
+                clear_center = channel_index.clear_center(
+                    (lower_freq + radio_high_freq + half_spectrum_bandwidth) // 2,
+                    math.ceil(radio_high_freq + half_spectrum_bandwidth - half_sample_rate),
+                    math.floor(lower_freq + half_sample_rate)
+                )
+                cost = (
+                    best[start][0] + 1,
+                    best[start][1] + sample_rate,
+                    best[start][2] + (0 if clear_center is not None else 1)
+                )
+                if best[end] is None or cost < best[end]:
+                    best[end] = cost
+                    window_start[end] = start
+
+        windows = []
+        end = channels
+        while end > 0:
+            start = window_start[end]
+            lower_freq = int(SYSTEM_FREQS[start] - half_spectrum_bandwidth)
+            windows.append(self.build_window(lower_freq, SYSTEM_FREQS[start:end], half_spectrum_bandwidth, channel_index))
+            end = start
+        windows.reverse()
+        return windows
+
+    def inventory_cuts(self, SYSTEM_FREQS, half_spectrum_bandwidth, inventory, kinds, channel_index):
+        """
+        plan_optimal's dynamic program over SDRs of the given kinds, [(start, end)] of the windows or None
 
-            # Set high and low and center and channel counts values for each radio
-            radio_matrixes[radio_index]["high"] = radio_high_freq
-            radio_matrixes[radio_index]["low"] = lower_freq
-            radio_matrixes[radio_index]["channels"] = len(radio_matrixes[radio_index]["freqs"])
-            radio_matrixes[radio_index]["center"] = int(self.calculate_center(lower_freq, radio_high_freq, SYSTEM_FREQS))
+        A window costs the lowest legal rate of any of the kinds wide enough for it
+        """
+        channels = len(SYSTEM_FREQS)
+        best = [None] * (channels + 1)
+        best[0] = (0, 0, 0)
+        window_start = [0] * (channels + 1)
+        widest = inventory.bandwidth(kinds[0])
+
+        for end in range(1, channels + 1):
+            if end < channels and SYSTEM_FREQS[end] == SYSTEM_FREQS[end - 1]:
+                continue
+
+            radio_high_freq = SYSTEM_FREQS[end - 1]
+            for start in range(bisect_right(SYSTEM_FREQS, radio_high_freq - widest), end):
+                if best[start] is None:
+                    continue
+                lower_freq = int(SYSTEM_FREQS[start] - half_spectrum_bandwidth)
+                choice = inventory.cheapest(inventory.needed(lower_freq, radio_high_freq, half_spectrum_bandwidth), kinds)
+                if choice is None:
+                    continue
+                rate, kind = choice
+                half_bandwidth = inventory.bandwidth(kind, rate) / 2
+                clear_center = channel_index.clear_center(
+                    (lower_freq + radio_high_freq + half_spectrum_bandwidth) // 2,
+                    math.ceil(radio_high_freq + half_spectrum_bandwidth - half_bandwidth),
+                    math.floor(lower_freq + half_bandwidth)
+                )
+                cost = (
+                    best[start][0] + 1,
+                    best[start][1] + rate,
+                    best[start][2] + (0 if clear_center is not None else 1)
+                )
+                if best[end] is None or cost < best[end]:
+                    best[end] = cost
+                    window_start[end] = start
+
+        if best[channels] is None:
+            return None
+        cuts = []
+        end = channels
+        while end > 0:
+            cuts.append((window_start[end], end))
+            end = window_start[end]
+        cuts.reverse()
+        return cuts
+
+    def inventory_exact(self, SYSTEM_FREQS, half_spectrum_bandwidth, inventory, channel_index):
+        """
+        [(start, end, rate, kind index)] of the best windows the devices of an sdr_inventory can take, or None
 
-            # get the total bandwidth needing covered
-            radio_sample_range = (radio_high_freq - lower_freq) + (half_spectrum_bandwidth * 2)
+        plan_optimal's dynamic program, with one best way to cover the first j
+        channels per count of devices taken of every kind but the narrowest, which
+        takes the rest of the windows
+        """
+        channels = len(SYSTEM_FREQS)
+        counts = [len(kind["devices"]) for kind in inventory.kinds]
+        narrowest = len(counts) - 1
+        widest = inventory.bandwidth(inventory.kinds[0])
+        # labels[j] is {devices taken of the wider kinds: (cost, (start, devices taken before, rate, kind index))}
+        labels = [{} for _ in range(channels + 1)]
+        labels[0][(0,) * narrowest] = ((0, 0, 0), None)
+
+        for end in range(1, channels + 1):
+            if end < channels and SYSTEM_FREQS[end] == SYSTEM_FREQS[end - 1]:
+                continue
+
+            radio_high_freq = SYSTEM_FREQS[end - 1]
+            for start in range(bisect_right(SYSTEM_FREQS, radio_high_freq - widest), end):
+                if not labels[start]:
+                    continue
+                lower_freq = int(SYSTEM_FREQS[start] - half_spectrum_bandwidth)
+                needed = inventory.needed(lower_freq, radio_high_freq, half_spectrum_bandwidth)
+                options = []
+                for kind_index, kind in enumerate(inventory.kinds):
+                    rate = inventory.rate(kind, needed)
+                    if rate is None:
+                        continue
+                    half_bandwidth = inventory.bandwidth(kind, rate) / 2
+                    clear_center = channel_index.clear_center(
+                        (lower_freq + radio_high_freq + half_spectrum_bandwidth) // 2,
+                        math.ceil(radio_high_freq + half_spectrum_bandwidth - half_bandwidth),
+                        math.floor(lower_freq + half_bandwidth)
+                    )
+                    options.append((kind_index, rate, 0 if clear_center is not None else 1))
+
+                for taken, (cost, _) in labels[start].items():
+                    for kind_index, rate, dc_hit in options:
+                        if kind_index == narrowest:
+                            if cost[0] - sum(taken) >= counts[narrowest]:
+                                continue
+                            next_taken = taken
+                        elif taken[kind_index] >= counts[kind_index]:
+                            continue
+                        else:
+                            next_taken = taken[:kind_index] + (taken[kind_index] + 1,) + taken[kind_index + 1:]
+                        next_cost = (cost[0] + 1, cost[1] + rate, cost[2] + dc_hit)
+                        label = labels[end].get(next_taken)
+                        if label is None or next_cost < label[0]:
+                            labels[end][next_taken] = (next_cost, (start, taken, rate, kind_index))
+
+        if not labels[channels]:
+            return None
+        taken = min(labels[channels], key=lambda taken: labels[channels][taken][0])
+        choices = []
+        end = channels
+        while end > 0:
+            start, previous, rate, kind_index = labels[end][taken][1]
+            choices.append((start, end, rate, kind_index))
+            end, taken = start, previous
+        choices.reverse()
+        return choices
+
+    def inventory_fitted(self, SYSTEM_FREQS, half_spectrum_bandwidth, inventory, channel_index):
+        """
+        inventory_exact for large inventories, windows are planned first and then placed on the devices
 
+        When there are too few of the wide SDRs for the windows the widest kind
+        stops setting how wide a window may be (it still takes windows) and the
+        channels are split again
+        """
+        for sizing in range(len(inventory.kinds)):
+            cuts = self.inventory_cuts(SYSTEM_FREQS, half_spectrum_bandwidth, inventory, inventory.kinds[sizing:], channel_index)
+            if cuts is None:
+                continue
+            needs = [inventory.needed(int(SYSTEM_FREQS[start] - half_spectrum_bandwidth), SYSTEM_FREQS[end - 1], half_spectrum_bandwidth) for start, end in cuts]
+            devices = inventory.assign(needs)
+            if devices is not None:
+                return [(start, end, rate, kind_index) for (start, end), (rate, kind_index) in zip(cuts, devices)]
+        return None
+
+    def plan_inventory(self, SYSTEM_FREQS, half_spectrum_bandwidth, inventory, channel_index):
+        """
+        Split the sorted channels into windows on the devices of an sdr_inventory
 
-            if radio_sample_range < 900000:
-                diff = 900000 - radio_sample_range
-                radio_sample_range += diff
+        Fewest SDRs, then lowest total sample rate, every SDR at one of its legal rates
+        """
+        widest = inventory.bandwidth(inventory.kinds[0])
+        window = max(end - bisect_right(SYSTEM_FREQS, SYSTEM_FREQS[end - 1] - widest) for end in range(1, len(SYSTEM_FREQS) + 1))
+        if inventory.states() * len(SYSTEM_FREQS) * window * len(inventory.kinds) <= INVENTORY_EXACT_WORK:
+            choices = self.inventory_exact(SYSTEM_FREQS, half_spectrum_bandwidth, inventory, channel_index)
+        else:
+            choices = self.inventory_fitted(SYSTEM_FREQS, half_spectrum_bandwidth, inventory, channel_index)
+        if choices is None:
+            raise ValueError(f"The {inventory.devices()} SDRs of the inventory can not cover all {len(SYSTEM_FREQS)} channels")
 
-            # Check if the sample rate is valid
-            is_divisable_by_eight = radio_sample_range % 8 == 0
+        sdrs = inventory.sdrs([(rate, kind_index) for _, _, rate, kind_index in choices])
+        return [
+            self.build_window(int(SYSTEM_FREQS[start] - half_spectrum_bandwidth), SYSTEM_FREQS[start:end], half_spectrum_bandwidth, channel_index, sdr["rate"], sdr)
+            for (start, end, _, _), sdr in zip(choices, sdrs)
+        ]
 
-            # Make the sample rate divisable by eight
-            while not is_divisable_by_eight:
-                radio_sample_range += 1
-                is_divisable_by_eight = radio_sample_range % 8 == 0                
+    def split_windows(self, SYSTEM_FREQS, half_spectrum_bandwidth, sdr_bandwidth, planner="greedy", inventory=None):
+        """
+        SdrWindows of the sorted channels with the given planner (or on an sdr_inventory), without logging or validating them
+        """
+        channel_index = ChannelIndex(SYSTEM_FREQS)
+        if inventory:
+            return self.plan_inventory(SYSTEM_FREQS, half_spectrum_bandwidth, inventory, channel_index)
+        if planner == "optimal":
+            return self.plan_optimal(SYSTEM_FREQS, half_spectrum_bandwidth, sdr_bandwidth, channel_index)
+        return self.plan_windows(SYSTEM_FREQS, half_spectrum_bandwidth, SYSTEM_FREQS[0] - half_spectrum_bandwidth, sdr_bandwidth, channel_index)
+
+    def plan_cost(self, SYSTEM_FREQS, MAX_SDR_BANDWIDTH=3.2, SPECTRUM_BANDWIDTH=12.5, PLANNER="greedy", INVENTORY=None):
+        """
+        (SDRs, total sample rate) plan_channels would come up with, quietly
+        """
+        half_spectrum_bandwidth = self.up_convert(float(SPECTRUM_BANDWIDTH), self.multipliers.khz) / 2
+        windows = self.split_windows(SYSTEM_FREQS, half_spectrum_bandwidth, self.up_convert(float(MAX_SDR_BANDWIDTH), self.multipliers.mhz), PLANNER, INVENTORY)
+        return len(windows), sum(window.sample_rate for window in windows)
 
+    def do_a_math(self, SYSTEM_FREQS, half_spectrum_bandwidth, lower_edge, sdr_bandwidth, planner="greedy", inventory=None):
+        windows = self.split_windows(SYSTEM_FREQS, half_spectrum_bandwidth, sdr_bandwidth, planner, inventory)
 
-            radio_matrixes[radio_index]["sample_rate"] = radio_sample_range
-            # incrment our radios - ie The next channel is beyond our bandwidth
-            radio_index += 1
+        # Dict to hold our results, radios are numbered from one
+        radio_matrixes = {radio_index: window.as_result() for radio_index, window in enumerate(windows, 1)}
 
-            # Check we havent reacherd the end of our channels
-            if indexed_channels < channels:
-                # Set to the next freq in the list minus half the spectrum BW
-                lower_freq = int(SYSTEM_FREQS[indexed_channels] - half_spectrum_bandwidth)
-                # Set to the max sdr reciveable bandwidth from the lower_freq
-                max_sdr_useable_freq = int((lower_freq + half_spectrum_bandwidth) + sdr_bandwidth)
-                #logging.warning(f"PREV: {lower_freq}  - NEXT: {max_sdr_useable_freq}")
-            
-        self.validate_coverage(radio_matrixes, SYSTEM_FREQS)
+        self.check_plan(self.verify_plan(radio_matrixes, SYSTEM_FREQS, half_spectrum_bandwidth), len(SYSTEM_FREQS))
         return radio_matrixes
 
+class Source(NamedTuple):
+    """
+    One SDR of a plan, center and rate in HZ, device is the rtl index
+
+    Inventory SDRs carry their own driver, device string and source settings
+    """
+    center: int
+    rate: int
+    recorders: int
+    device: int
+    driver: str = "osmosdr"
+    device_string: str = None
+    settings: dict = None
+
+    def as_config(self):
+        return {
+            **trunk_recorder_helper.source_template,
+            **(self.settings or {}),
+            "center": self.center,
+            "rate": self.rate,
+            "digitalRecorders": self.recorders,
+            "driver": self.driver,
+            "device": self.device_string or f"rtl={self.device}",
+        }
+
+
 class trunk_recorder_helper:
     source_template = {
         "center": 0,
@@ -341,55 +1562,1151 @@ class trunk_recorder_helper:
         "logFile": True,
         }
 
-def fetchSystemData(SYSTEMS, DOWNLOAD_TALKGROUPS, RR_USER, RR_PASS, USE_RR_SITE_ID):
+    @classmethod
+    def system_config(cls, system, site, control_channels=None):
+        """
+        System config of one Site of a System, control_channels overrides the site's own
+        """
+        site_type = system.type
+        if site_type == "p25":
+            modulation = "qpsk"
+            if not site.modulation == "CPQSK":
+                modulation = "fsk4"
+            else:
+                modulation = "qpsk"
+        else:
+            modulation = "fsk4"
+
+        # Only the list in the template is mutable, it is replaced rather than shared
+        return {
+            **cls.system_template,
+            "control_channels": list(site.control_channels if control_channels is None else control_channels),
+            "type": site_type,
+            "modulation": modulation,
+            "rrsysid": system.system_id,
+            "rrsiteid": str(site.rr_site_id),
+        }
+
+    @classmethod
+    def build_systems(cls, system_results):
+        """
+        System configs for every site of system_results (Systems)
+        """
+        return [cls.system_config(system, site) for system in system_results for site in system.sites]
+
+    @classmethod
+    def build_sources(cls, result, load, fixed_sample_rate=None):
+        """
+        Sources of a find_freqs result, sized by a capacity_model.plan_load
+        """
+        TR = tr_autotune()
+        sources = []
+        for radio_index, source_load in zip(result["results"], load["sources"]):
+            if fixed_sample_rate:
+                rate = int(TR.up_convert(fixed_sample_rate, TR.multipliers.mhz))
+            else:
+                rate = int(result["results"][radio_index]["sample_rate"])
+            sdr = result["results"][radio_index].get("sdr")
+            sources.append(Source(
+                center=result["results"][radio_index]["center"],
+                rate=rate,
+                recorders=source_load["recorders"],
+                device=radio_index - 1,
+                driver=sdr["driver"] if sdr else "osmosdr",
+                device_string=sdr["device"] if sdr else None,
+                settings=sdr["source"] if sdr else None
+            ))
+        return sources
+
+    @classmethod
+    def config(cls, systems, sources):
+        """
+        A whole trunk-recorder config of system configs and Sources
+        """
+        return {
+            **cls.base,
+            "sources": [source.as_config() for source in sources],
+            "systems": list(systems),
+        }
+
+
+class sdr_inventory:
+    """
+    The SDRs at hand for the inventory planner, kinds of devices with their legal sample rates
+
+    The inventory is JSON, rates are in MHz. usable is the part of a rate the
+    device's filters pass (1.0 by default), cpu_per_msps overrides --cpu_per_msps
+    for its sources, usb_msps is the USB Msps one Msps of its rate takes (1.0 for
+    8 bit I/Q like USB_BUS_MAX_MSPS counts, 2.0 for 16 bit), source is merged into
+    their configs and driver is osmosdr unless given. Every entry of devices is one
+    SDR, its trunk-recorder device string. usb_max_msps is what the USB of the host
+    carries, plans over it are warned about
+    {"usb_max_msps": 40,
+     "sdrs": [{"name": "airspy", "devices": ["airspy=0"], "rates": [2.5, 10], "usable": 0.8, "cpu_per_msps": 8, "usb_msps": 2.0, "source": {"gain": 16}},
+              {"name": "rtl", "devices": ["rtl=00000101", "rtl=00000102"], "rates": [1.024, 2.048, 2.4]}]}
+    """
+    def __init__(self, inventory):
+        if isinstance(inventory, str):
+            with open(inventory) as f:
+                inventory = json.load(f)
+        self.kinds = []
+        for kind in inventory["sdrs"]:
+            if not kind.get("devices") or not kind.get("rates"):
+                raise ValueError(f"SDR {kind.get('name', '')} of the inventory needs devices and rates")
+            self.kinds.append({
+                "name": kind.get("name", kind["devices"][0]),
+                "driver": kind.get("driver", "osmosdr"),
+                "devices": list(kind["devices"]),
+                "rates": sorted(int(round(float(rate) * tr_autotune.multipliers.mhz)) for rate in kind["rates"]),
+                "usable": float(kind.get("usable", 1.0)),
+                "cpu_per_msps": kind.get("cpu_per_msps"),
+                "usb_msps": float(kind.get("usb_msps", 1.0)),
+                "source": dict(kind.get("source") or {}),
+            })
+        self.usb_max_msps = inventory.get("usb_max_msps")
+        if not self.kinds:
+            raise ValueError("SDR inventory has no SDRs")
+        # Widest first, a window one kind can take every kind before it can too
+        self.kinds.sort(key=self.bandwidth, reverse=True)
+
+    def bandwidth(self, kind, rate=None):
+        """
+        Usable bandwidth (HZ) of kind at rate, at its highest rate by default
+        """
+        return (rate if rate is not None else kind["rates"][-1]) * kind["usable"]
 
-    SYSTEM_RESULTS = []
-    TR = tr_autotune()
+    def devices(self):
+        return sum(len(kind["devices"]) for kind in self.kinds)
 
+    def over_usb(self, load):
+        return self.usb_max_msps is not None and load["usb_msps"] > self.usb_max_msps
+
+    def states(self):
+        """
+        Combinations of devices of the wider kinds a plan can take, inventory_exact's states per channel
+        """
+        return math.prod(len(kind["devices"]) + 1 for kind in self.kinds[:-1])
+
+    @staticmethod
+    def needed(lower_freq, upper_freq, half_spectrum_bandwidth):
+        """
+        Bandwidth a window opening at lower_freq with its last channel at upper_freq needs, like tr_autotune.sample_rate without its minimum
+        """
+        return (upper_freq - lower_freq) + half_spectrum_bandwidth * 2
+
+    def rate(self, kind, needed):
+        """
+        Lowest rate of kind passing needed HZ, or None
+        """
+        for rate in kind["rates"]:
+            if self.bandwidth(kind, rate) >= needed:
+                return rate
+        return None
+
+    def cheapest(self, needed, kinds):
+        """
+        (rate, kind) of the kinds with the lowest rate passing needed HZ, or None
+        """
+        best = None
+        for kind in kinds:
+            rate = self.rate(kind, needed)
+            if rate is not None and (best is None or rate < best[0]):
+                best = (rate, kind)
+        return best
+
+    def fits(self, needs, left):
+        """
+        Whether windows needing these bandwidths fit on the left devices of every kind
+
+        Kinds are widest first, so the windows only the first n kinds can take must
+        not outnumber their devices, for every n
+        """
+        for last in range(len(self.kinds)):
+            narrower = self.bandwidth(self.kinds[last + 1]) if last + 1 < len(self.kinds) else 0
+            if sum(1 for needed in needs if needed > narrower) > sum(left[:last + 1]):
+                return False
+        return not needs or max(needs) <= self.bandwidth(self.kinds[0])
+
+    def assign(self, needs):
+        """
+        (rate, kind index) of every window needing these bandwidths or None when they don't fit
+
+        Widest windows first, each on the kind with the lowest rate passing it
+        that leaves the rest of the windows a device
+        """
+        left = [len(kind["devices"]) for kind in self.kinds]
+        if not self.fits(needs, left):
+            return None
+
+        choices = [None] * len(needs)
+        order = sorted(range(len(needs)), key=lambda window: needs[window], reverse=True)
+        for position, window in enumerate(order):
+            rest = [needs[other] for other in order[position + 1:]]
+            options = []
+            for kind_index, kind in enumerate(self.kinds):
+                rate = self.rate(kind, needs[window])
+                if left[kind_index] and rate is not None:
+                    options.append((rate, kind_index))
+            for rate, kind_index in sorted(options):
+                left[kind_index] -= 1
+                if self.fits(rest, left):
+                    choices[window] = (rate, kind_index)
+                    break
+                left[kind_index] += 1
+        return choices
+
+    def sdrs(self, choices):
+        """
+        The sdr of every (rate, kind index) of a plan, devices of a kind are handed out in plan order
+        """
+        used = [0] * len(self.kinds)
+        sdrs = []
+        for rate, kind_index in choices:
+            kind = self.kinds[kind_index]
+            sdrs.append({
+                "kind": kind["name"],
+                "driver": kind["driver"],
+                "device": kind["devices"][used[kind_index]],
+                "rate": rate,
+                "usable_bandwidth": self.bandwidth(kind, rate),
+                "cpu_per_msps": kind["cpu_per_msps"],
+                "usb_msps": kind["usb_msps"],
+                "source": kind["source"],
+            })
+            used[kind_index] += 1
+        return sdrs
+
+
+class shard_planner:
+    """
+    Spreads the sources of a plan over an inventory of hosts and their USB buses
+
+    The inventory is JSON, cpu (percent of one core) and the bus limits are optional
+    {"hosts": [{"name": "node1", "cpu": 400, "usb_buses": [{"id": "1", "max_msps": 20, "max_devices": 4}]}]}
+    """
+    def __init__(self, inventory):
+        if isinstance(inventory, str):
+            with open(inventory) as f:
+                inventory = json.load(f)
+        self.hosts = inventory["hosts"]
+        if not self.hosts:
+            raise ValueError("Host inventory has no hosts")
+
+    def _try_place(self, host, buses, sources):
+        """
+        First fit decreasing of sources onto the buses of host, returns {source: bus} or None
+        """
+        used = [dict(bus) for bus in buses]
+        cpu = host["cpu_used"]
+        placement = {}
+        for source in sorted(sources, key=lambda source: source["msps"], reverse=True):
+            cpu += source["cpu"]
+            if host.get("cpu") is not None and cpu > host["cpu"]:
+                return None
+            for bus_index, bus in enumerate(used):
+                if bus["msps"] + source["msps"] <= bus["max_msps"] and bus["devices"] < bus["max_devices"]:
+                    bus["msps"] += source["msps"]
+                    bus["devices"] += 1
+                    placement[source["index"]] = bus_index
+                    break
+            else:
+                return None
+        return placement
+
+    def shard(self, group, result, sources, load):
+        """
+        {host name: config} for the Systems of group and the Sources of their plan
+
+        Sources carrying channels of the same site are kept on one host where they
+        fit, groups go to the least loaded host first so load stays balanced
+        """
+        TR = tr_autotune()
+        hosts = [dict(host, cpu_used=0.0) for host in self.hosts]
+        buses = [
+            [
+                {"id": bus.get("id", str(bus_index)), "max_msps": bus.get("max_msps", USB_BUS_MAX_MSPS), "max_devices": bus.get("max_devices", math.inf), "msps": 0.0, "devices": 0}
+                for bus_index, bus in enumerate(host.get("usb_buses") or [{}])
+            ]
+            for host in self.hosts
+        ]
+
+        radios = list(result["results"].values())
+        freq_source = {freq: index for index, radio in enumerate(radios) for freq in radio["freqs"]}
+        shard_sources = [
+            {"index": index, "msps": source.rate / TR.multipliers.mhz, "cpu": source_load["cpu"]}
+            for index, (source, source_load) in enumerate(zip(sources, load["sources"]))
+        ]
+
+        # Union the sources each site needs so its control and voice channels stay together
+        parent = list(range(len(sources)))
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        sites = [(system, site) for system in group for site in system.sites]
+        site_sources = []
+        for _, site in sites:
+            needed = sorted({freq_source[freq] for freq in site.freqs})
+            site_sources.append(needed)
+            for index in needed[1:]:
+                parent[find(index)] = find(needed[0])
+
+        affinity = {}
+        for source in shard_sources:
+            affinity.setdefault(find(source["index"]), []).append(source)
+
+        def host_load(host_index):
+            capacity = sum(bus["max_msps"] for bus in buses[host_index])
+            return sum(bus["msps"] for bus in buses[host_index]) / capacity
+
+        source_host = {}
+        def place(members):
+            for host_index in sorted(range(len(hosts)), key=host_load):
+                placement = self._try_place(hosts[host_index], buses[host_index], members)
+                if placement is None:
+                    continue
+                for source in members:
+                    bus = buses[host_index][placement[source["index"]]]
+                    bus["msps"] += source["msps"]
+                    bus["devices"] += 1
+                    hosts[host_index]["cpu_used"] += source["cpu"]
+                    source_host[source["index"]] = (host_index, bus["id"])
+                return True
+            return False
+
+        for members in sorted(affinity.values(), key=lambda members: sum(source["msps"] for source in members), reverse=True):
+            if place(members):
+                continue
+            logging.warning(f"[-] Sources {[source['index'] + 1 for source in members]} share sites but do not fit on one host, splitting them")
+            for source in sorted(members, key=lambda source: source["msps"], reverse=True):
+                if not place([source]):
+                    raise ValueError(f"Source {source['index'] + 1} ({source['msps']} Msps) does not fit on any host")
+
+        configs = {}
+        for host_index, host in enumerate(hosts):
+            host_sources = sorted((index for index in source_host if source_host[index][0] == host_index), key=lambda index: (source_host[index][1], index))
+            if not host_sources:
+                continue
+
+            host_systems = []
+            # A site runs where its control channels are received, only with the ones this host can hear
+            for (system, site), needed in zip(sites, site_sources):
+                control_channels = [freq for freq in site.control_channels if source_host[freq_source[freq]][0] == host_index]
+                if not control_channels:
+                    continue
+                if any(source_host[index][0] != host_index for index in needed):
+                    logging.warning(f"[-] Site {site.rr_site_id} has voice channels on sources of another host than {host['name']}")
+                host_systems.append(trunk_recorder_helper.system_config(system, site, control_channels))
+
+            logging.info(f"[+] {host['name']} gets {len(host_sources)} sources, {round(host['cpu_used'], 1)}% CPU")
+            configs[host["name"]] = trunk_recorder_helper.config(
+                host_systems,
+                [sources[index]._replace(device=device_index) for device_index, index in enumerate(host_sources)]
+            )
+        return configs
+
+
+class capacity_model:
+    """
+    Sizes recorders per source and predicts trunk-recorder's CPU load (percent of one core)
+    """
+    def __init__(self, max_recorders=None, host_cpu=None, cpu_per_msps=CPU_PER_MSPS, cpu_per_recorder=CPU_PER_RECORDER, call_log=None, headroom=RECORDER_HEADROOM):
+        """
+        call_log is a CSV with freq, start_time and stop_time columns (one row per
+        call), when given sources get recorders for the busiest moment seen instead
+        of one per voice channel
+        """
+        self.max_recorders = max_recorders
+        self.host_cpu = host_cpu
+        self.cpu_per_msps = cpu_per_msps
+        self.cpu_per_recorder = cpu_per_recorder
+        self.headroom = headroom
+        self.calls = None
+        if call_log:
+            self.calls = self.load_call_log(call_log)
+
+    def load_call_log(self, path):
+        calls = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                freq = float(row["freq"])
+                # Accept MHz or HZ
+                if freq < 1e5:
+                    freq = freq * tr_autotune.multipliers.mhz
+                calls.append((int(freq), float(row["start_time"]), float(row["stop_time"])))
+        calls.sort()
+        logging.info(f"[+] Loaded {len(calls)} calls from {path}")
+        return calls
+
+    def peak_concurrency(self, low, high):
+        """
+        Most calls ever active at once on frequencies between low and high (HZ)
+        """
+        first = bisect_left(self.calls, (low,))
+        last = bisect_right(self.calls, (high, math.inf, math.inf))
+        # Stops sort before starts at the same instant
+        events = sorted([(start, 1) for _, start, _ in self.calls[first:last]] + [(stop, -1) for _, _, stop in self.calls[first:last]])
+        active, peak = 0, 0
+        for _, change in events:
+            active += change
+            peak = max(peak, active)
+        return peak
+
+    def size_recorders(self, radio, control_channels):
+        """
+        Recorders one source needs, control channels never need one
+        """
+        voice_channels = len([freq for freq in radio["freqs"] if freq not in control_channels])
+        recorders = voice_channels
+        if self.calls is not None and voice_channels:
+            recorders = min(voice_channels, max(1, math.ceil(self.peak_concurrency(radio["low"], radio["high"]) * self.headroom)))
+        if self.max_recorders is not None and recorders > self.max_recorders:
+            logging.warning(f"[-] Source at {radio['center']} wants {recorders} recorders, capped to {self.max_recorders}")
+            recorders = self.max_recorders
+        return recorders
+
+    def plan_load(self, result, control_channels, fixed_sample_rate=None):
+        """
+        Recorders, predicted CPU and USB Msps for every source of a find_freqs result
+        """
+        sources = []
+        for radio in result["results"].values():
+            rate = radio["sample_rate"]
+            if fixed_sample_rate:
+                rate = fixed_sample_rate * tr_autotune.multipliers.mhz
+            recorders = self.size_recorders(radio, control_channels)
+            sdr = radio.get("sdr") or {}
+            cpu_per_msps = sdr.get("cpu_per_msps") or self.cpu_per_msps
+            sources.append({
+                "recorders": recorders,
+                "cpu": round(rate / tr_autotune.multipliers.mhz * cpu_per_msps + recorders * self.cpu_per_recorder, 1),
+                "usb_msps": round(rate / tr_autotune.multipliers.mhz * sdr.get("usb_msps", 1.0), 3)
+            })
+        return {
+            "cpu": round(sum(source["cpu"] for source in sources), 1),
+            "usb_msps": round(sum(source["usb_msps"] for source in sources), 3),
+            "sources": sources
+        }
+
+    def over_budget(self, load):
+        return self.host_cpu is not None and load["cpu"] > self.host_cpu
+
+
+def content_hash(content):
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.sha256(content).hexdigest()
+
+
+def write_if_changed(path, content):
+    """
+    Atomically replace path with content unless it already holds exactly that, returns True if it was written
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+    return True
+
+
+def replace_if_changed(temp_path, path):
+    """
+    Move temp_path over path unless path already holds the same content, returns True if it was replaced
+    """
+    if os.path.exists(path) and filecmp.cmp(temp_path, path, shallow=False):
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+
+class output_manifest:
+    """
+    Hashes of the normalized RR inputs and the generated files of every config in an output directory
+
+    Configs whose inputs (and planning settings) are unchanged and whose files
+    are still on disk as written are neither re-planned nor rewritten
+    """
+    def __init__(self, output_dir, force=False):
+        self.path = os.path.join(output_dir or ".", MANIFEST_NAME)
+        self.force = force
+        self.groups = {}
+        self.changed = []
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.groups = json.load(f)["groups"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def inputs_hash(group, settings):
+        """
+        Hash of a group's RR data and the settings (tr_job.settings) it is planned with
+        """
+        return content_hash(json.dumps([settings, group], sort_keys=True, cls=DecimalEncoder))
+
+    def unchanged(self, name, inputs):
+        entry = self.groups.get(name)
+        if self.force or not entry or entry["inputs"] != inputs:
+            return False
+        for filename, digest in entry["files"].items():
+            try:
+                with open(filename, 'rb') as f:
+                    if content_hash(f.read()) != digest:
+                        return False
+            except OSError:
+                return False
+        return True
+
+    def previous_file(self, name, config_name, content):
+        """
+        The file config_name of group name was last written to, if it holds content
+        """
+        entry = self.groups.get(name, {})
+        filename = entry.get("configs", {}).get(config_name)
+        if filename and entry["files"].get(filename) == content_hash(content) and os.path.exists(filename):
+            return filename
+        return None
+
+    def write(self, filename, content):
+        changed = write_if_changed(filename, content)
+        if changed:
+            with self._lock:
+                self.changed.append(filename)
+        return changed
+
+    def record(self, name, inputs, configs, files):
+        """
+        configs maps config names to the files written and files those files to their content
+        """
+        self.groups[name] = {
+            "inputs": inputs,
+            "configs": configs,
+            "files": {filename: content_hash(content) for filename, content in files.items()}
+        }
+
+    def save(self):
+        # Nothing may have been written yet when every group failed
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_if_changed(self.path, json.dumps({"version": VERSION, "groups": self.groups}, indent=4, sort_keys=True))
+
+
+def fetchSystemData(SYSTEMS, DOWNLOAD_TALKGROUPS, RR_USER, RR_PASS, USE_RR_SITE_ID, CACHE=None, WORKERS=FETCH_WORKERS, WSDL=RR_WSDL, RECORD=None, REPLAY=None, CHANGED=None, API=None, TAGS=None, FORMATS=("csv",), PROFILE=None, PARTITIONS=None):
+    """
+    CHANGED collects the talkgroup files written (in FORMATS), pass API and TAGS to share the client and tag memo between calls
+    and PARTITIONS to fetch talkgroups that many categories at a time
+
+    PROFILE (a perf_profile) is only used when no API is passed, otherwise the API's own profile is
+    """
+    if TAGS is None:
+        TAGS = {}
+    if API is None:
+        API = rr_api(
+            RR_USER,
+            RR_PASS,
+            wsdl=WSDL,
+            cache_dir=CACHE.cache_dir if CACHE else None,
+            record_dir=RECORD,
+            replay_dir=REPLAY,
+            profile=PROFILE
+        )
     # Get Sites radio configs and list frequencies and channels
-    for SYSTEM in SYSTEMS:
-        System = RR(SYSTEM["system_id"], RR_USER, RR_PASS)
-        results = System.fetch_site_data(SYSTEM["sites"], use_rr_id=USE_RR_SITE_ID, add_metadata=DOWNLOAD_TALKGROUPS)
+    def fetch_system(SYSTEM):
+        rr = RR(SYSTEM["system_id"], RR_USER, RR_PASS, cache=CACHE, tags=TAGS, api=API)
+        with API.profile.phase("fetch"):
+            results = rr.fetch_site_data(SYSTEM["sites"], use_rr_id=USE_RR_SITE_ID, add_metadata=DOWNLOAD_TALKGROUPS, partitions=PARTITIONS)
 
         if DOWNLOAD_TALKGROUPS:
-            talkgroups = results["talkgroups"]
-            with open(f"tr_trs_tg_{SYSTEM['system_id']}.csv", 'w') as f:
-                f.write("Decimal,Hex,Alpha Tag,Mode,Description,Tag,Category\n")
-                for talkgroup in talkgroups:
-                    hex_dec = hex(int(talkgroup["tgDec"])).strip("0x")
-                    f.write(f'{talkgroup["tgDec"]},{hex_dec},{talkgroup["tgAlpha"]},{talkgroup["tgMode"].upper().replace("DE","E")},{talkgroup["tgDescr"]},{talkgroup["tag"]},{talkgroup["cat"]}\n')
-
-        sites = []
-        for site in results["sites"]:
-            freqs = [float(freq["freq"]) for freq in site["data"]["siteFreqs"]]
-            control_channels = []
-            for freq in site["data"]["siteFreqs"]:
-                if freq["use"]: control_channels.append(int(TR.up_convert(float(freq['freq']), TR.multipliers.mhz)))
-
-            payload = {
-                "id": site["data"]["siteNumber"],
-                "rr_site_id": site["rr_site_id"],
-                "freqs": freqs,
-                "control_channels": control_channels,
-                "modulation": site["data"]["siteModulation"]
-                }
-            sites.append(payload)
-
-        SYSTEM_RESULTS.append({
-            "system_id": SYSTEM["system_id"],
-            "sites": sites,
-            "system_type": results["system"]["sType"]
-        })
+            with API.profile.phase("talkgroups"):
+                changed = talkgroup_export(f"tr_trs_tg_{SYSTEM['system_id']}", FORMATS).write(results["talkgroups"])
+            for filename in changed:
+                logging.warning(f"[+] Wrote talkgroups - {filename}")
+            if CHANGED is not None:
+                CHANGED.extend(changed)
+
+        return System(
+            system_id=SYSTEM["system_id"],
+            system_type=results["system"]["sType"],
+            sites=tuple(results["sites"])
+        )
+
+    # Fetch all systems at once, map() hands the results back in the order they were asked for
+    with ThreadPoolExecutor(max_workers=max(1, min(WORKERS, len(SYSTEMS)))) as pool:
+        SYSTEM_RESULTS = list(pool.map(fetch_system, SYSTEMS))
     return SYSTEM_RESULTS
 
-def startup():
-    parser = argparse.ArgumentParser(description='Generate TR config with RR data')
-    parser.add_argument('-s','--system', nargs='+', help='List of Systems : site pairs "SystemID:siteID,siteID"', required=True)
+
+def parse_systems(system_pairs):
+    """
+    [{"system_id", "sites"}] from "SystemID:siteID,siteID" pairs
+    """
+    systems = []
+    for system_pair in system_pairs:
+        system_id, sites = system_pair.split(":")
+        systems.append({"system_id": system_id, "sites": sites.split(",")})
+    return systems
+
+
+class tr_job:
+    """
+    Settings of one configurator run, the command line or one entry of a --jobs file
+    """
+    def __init__(self, args, name=None):
+        if args.sdr_max_sample_rate and args.sdr_fixed_sample_rate:
+            raise ValueError("You can only use '--sdr_max_sample_rate' or '--sdr_fixed_sample_rate' ")
+        try:
+            self.systems = parse_systems(args.system)
+        except (TypeError, ValueError):
+            raise ValueError("Systems must be in '--system <SYSTEM ID>:<SITE ID>,<SITE ID> <SYSTEM ID>:<SITE ID>' notation")
+
+        self.args = args
+        self.name = name or " ".join(args.system)
+
+        self.sample_rate = 3.2
+        self.fixed_sample_rate = None
+        if args.sdr_fixed_sample_rate:
+            self.fixed_sample_rate = float(args.sdr_fixed_sample_rate)
+            # A window's rate is the span of its channels plus one and a half channel bandwidths (rounded up
+            # to 8HZ), which has to fit in the fixed rate or the outer channels fall out of the passband
+            self.sample_rate = self.fixed_sample_rate - 1.5 * float(args.spectrum_bandwidth) / 1000 - 0.000008
+        if args.sdr_max_sample_rate:
+            self.sample_rate = float(args.sdr_max_sample_rate)
+
+        self.capacity = capacity_model(
+            max_recorders=args.max_recorders,
+            host_cpu=args.host_cpu,
+            cpu_per_msps=args.cpu_per_msps,
+            cpu_per_recorder=args.cpu_per_recorder,
+            call_log=args.call_log,
+            headroom=args.recorder_headroom
+        )
+        self.shards = None
+        if args.hosts:
+            # Host and bus usage is only tracked within one config
+            if len(self.systems) > 1 and not args.merge:
+                raise ValueError("'--hosts' splits one config across the hosts, several systems have to be '--merge'd")
+            self.shards = shard_planner(args.hosts)
+        self.inventory = None
+        if args.sdr_inventory:
+            if args.sdr_fixed_sample_rate or args.hosts:
+                raise ValueError("'--sdr_inventory' picks the rate and device of every SDR, it can't be used with '--sdr_fixed_sample_rate' or '--hosts'")
+            # Every config is planned on every device of the inventory
+            if len(self.systems) > 1 and not args.merge:
+                raise ValueError("'--sdr_inventory' hands out its devices to one config, several systems have to be '--merge'd")
+            self.inventory = sdr_inventory(args.sdr_inventory)
+
+        # Everything besides the RR data that changes what gets written
+        self.settings = {
+            "version": VERSION,
+            "sample_rate": self.sample_rate,
+            "fixed_sample_rate": self.fixed_sample_rate,
+            "spectrum_bandwidth": args.spectrum_bandwidth,
+            "planner": args.planner,
+            "random_file_name": args.random_file_name,
+            "capacity": vars(self.capacity),
+            "hosts": self.shards.hosts if self.shards else None,
+            "site_subset": args.site_subset,
+            "keep_sites": args.keep_sites,
+            "sdr_inventory": self.inventory.kinds if self.inventory else None,
+        }
+
+    def groups(self, system_results):
+        """
+        (config name, systems) pairs to plan, one per system or a single merged one
+        """
+        if self.args.merge:
+            return [(".".join([system["system_id"] for system in self.systems]) + ".merged", system_results)]
+        return [(system.system_id, [system]) for system in system_results]
+
+
+def select_sites(name, group, job, TR):
+    """
+    The group with the fewest sites (and SDRs) that still covers what is needed
+
+    Every system keeps at least one site (and so its control channels), the
+    --keep_sites always stay and every frequency of the --call_log a candidate
+    site carries stays covered. Up to SITE_SUBSET_EXACT optional sites every
+    subset is planned and the one with the fewest SDRs, then sites, then total
+    sample rate wins. Beyond that sites are dropped one at a time, the drop
+    leaving the cheapest plan first, as long as it needs no more SDRs.
+    """
+    keep = {int(site) for site in job.args.keep_sites or []}
+    sites = [(system_index, site) for system_index, system in enumerate(group) for site in system.sites]
+    candidate_freqs = {freq for _, site in sites for freq in site.freqs}
+    busy_freqs = set()
+    if job.capacity.calls:
+        busy_freqs = {freq for freq, _, _ in job.capacity.calls} & candidate_freqs
+
+    def site_key(site):
+        return site.rr_site_id if job.args.use_rr_site_id else site.id
+    mandatory = [index for index, (_, site) in enumerate(sites) if site_key(site) in keep]
+    optional = [index for index in range(len(sites)) if index not in mandatory]
+
+    def covers(chosen):
+        if {sites[index][0] for index in chosen} != set(range(len(group))):
+            return False
+        return busy_freqs <= {freq for index in chosen for freq in sites[index][1].freqs}
+
+    def cost(chosen):
+        channels = sorted({freq for index in chosen for freq in sites[index][1].freqs})
+        sdrs, throughput = TR.plan_cost(channels, job.sample_rate, job.args.spectrum_bandwidth, job.args.planner, job.inventory)
+        return sdrs, len(chosen), throughput
+
+    best = list(range(len(sites)))
+    best_cost = cost(best)
+    if len(optional) <= SITE_SUBSET_EXACT:
+        for size in range(len(optional)):
+            for subset in itertools.combinations(optional, size):
+                chosen = sorted(mandatory + list(subset))
+                if covers(chosen):
+                    chosen_cost = cost(chosen)
+                    if chosen_cost < best_cost:
+                        best, best_cost = chosen, chosen_cost
+    else:
+        while True:
+            drops = [[index for index in best if index != drop] for drop in best if drop in optional]
+            drops = [(cost(chosen), chosen) for chosen in drops if covers(chosen)]
+            if not drops:
+                break
+            drop_cost, chosen = min(drops)
+            if drop_cost[0] > best_cost[0]:
+                break
+            best, best_cost = chosen, drop_cost
+
+    dropped = [site_key(sites[index][1]) for index in range(len(sites)) if index not in best]
+    if dropped:
+        logging.warning(f"[+] {name} keeps {len(best)} of {len(sites)} sites, dropping {', '.join(str(site) for site in dropped)}")
+    return [
+        system._replace(sites=tuple(site for index, (system_index, site) in enumerate(sites) if system_index == group_index and index in best))
+        for group_index, system in enumerate(group)
+    ]
+
+
+def plan_group(name, group, job, profile=None):
+    """
+    Plan the SDRs of a group of fetched systems, returns ({config name: config}, plan)
+
+    Module level and only fed picklable arguments so --jobs can run it in a process pool,
+    which is also why profile (a perf_profile) is only passed when planning in process
+    """
+    TR = tr_autotune(profile)
+    CAPACITY = job.capacity
+    PLANNER = job.args.planner
+
+    if job.args.site_subset:
+        group = select_sites(name, group, job, TR)
+
+    channels = group_channels(group)
+    control_channels = {freq for system in group for site in system.sites for freq in site.control_channels}
+
+    result = TR.plan_channels(channels, job.sample_rate, job.args.spectrum_bandwidth, PLANNER, job.inventory)
+    load = CAPACITY.plan_load(result, control_channels, job.fixed_sample_rate)
+    if CAPACITY.over_budget(load) and PLANNER != "optimal" and not job.inventory:
+        logging.warning(f"[-] {name} needs {load['cpu']}% CPU, over the {CAPACITY.host_cpu}% budget, re-planning with the optimal planner")
+        replanned = TR.plan_channels(channels, job.sample_rate, job.args.spectrum_bandwidth, "optimal")
+        replanned_load = CAPACITY.plan_load(replanned, control_channels, job.fixed_sample_rate)
+        if replanned_load["cpu"] < load["cpu"]:
+            result, load = replanned, replanned_load
+    if job.fixed_sample_rate:
+        # A fixed sample rate widens every passband past the planned one, check the sources as written
+        TR.check_plan(
+            TR.verify_plan(
+                result["results"],
+                channels,
+                TR.up_convert(float(job.args.spectrum_bandwidth), TR.multipliers.khz) / 2,
+                control_channels,
+                TR.up_convert(job.fixed_sample_rate, TR.multipliers.mhz)
+            ),
+            len(channels)
+        )
+    if CAPACITY.over_budget(load):
+        logging.warning(f"[!] {name} needs {load['cpu']}% CPU, over the {CAPACITY.host_cpu}% budget")
+    else:
+        logging.info(f"[+] {name} needs {load['cpu']}% CPU over {len(load['sources'])} sources")
+    if job.inventory and job.inventory.over_usb(load):
+        logging.warning(f"[!] {name} needs {load['usb_msps']} USB Msps, over the {job.inventory.usb_max_msps} Msps the inventory's host carries")
+
+    sources = trunk_recorder_helper.build_sources(result, load, job.fixed_sample_rate)
+
+    if job.shards:
+        return {f"{name}.{host}": config for host, config in job.shards.shard(group, result, sources, load).items()}, result
+
+    return {name: trunk_recorder_helper.config(trunk_recorder_helper.build_systems(group), sources)}, result
+
+
+def write_configs(name, inputs, configs, job, manifest):
+    """
+    Write the configs of a group through its output manifest, returns the files that changed
+    """
+    OUTPUT_DIR = job.args.output_dir
+    if OUTPUT_DIR:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    changed = []
+    written = {}
+    files = {}
+    for config_name, config in configs.items():
+        content = json.dumps(config, indent=4)
+        if OUTPUT_DIR:
+            filename = f"{OUTPUT_DIR}/{config_name}.config.json"
+        else:
+            filename = f"{config_name}.config.json"
+        if job.args.random_file_name:
+            # Keep the last random name while the config is the same, a new one only for new content
+            filename = manifest.previous_file(name, config_name, content) or filename[:-len('.json')] + '.' + str(uuid.uuid4()) + '.json'
+
+        if manifest.write(filename, content):
+            logging.warning(f"[+] Wrote config - {filename}")
+            changed.append(filename)
+        else:
+            logging.info(f"[+] Config unchanged - {filename}")
+        written[config_name] = filename
+        files[filename] = content
+
+        if job.args.print:
+            print(content)
+
+    manifest.record(name, inputs, written, files)
+    return changed
+
+
+def timed(function, *args):
+    """
+    (function(*args), seconds taken), module level so it can wrap work sent to a process pool
+    """
+    start = time.perf_counter()
+    return function(*args), time.perf_counter() - start
+
+
+def check_choices(job_args, where):
+    """
+    Raises a ValueError on a JOB_CHOICES option outside of its choices, what argparse does for the command line
+    """
+    for option, choices in JOB_CHOICES.items():
+        values = getattr(job_args, option, None)
+        for value in values if isinstance(values, list) else [values]:
+            if value is not None and value not in choices:
+                raise ValueError(f"{where} {option} {value!r} is not one of {', '.join(choices)}")
+
+
+def load_jobs(path, args):
+    """
+    tr_jobs of a JSON or YAML (needs PyYAML) jobs file
+
+    {"defaults": {<option>: <value>}, "jobs": [{"name": "county", "system": ["6699:33559,17501"], <option>: <value>}]}
+    Options are the long command line option names in JOB_OPTIONS, unset ones come from defaults, then the command line
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+
+    defaults = data.get("defaults") or {}
+    jobs = []
+    for index, entry in enumerate(data.get("jobs") or []):
+        entry = dict(entry)
+        name = str(entry.pop("name", index))
+        unknown = [option for option in {**defaults, **entry} if option not in JOB_OPTIONS]
+        if unknown:
+            raise ValueError(f"Job {name} has unknown options {', '.join(unknown)}")
+
+        job_args = argparse.Namespace(**{**vars(args), **defaults, **entry})
+        if isinstance(job_args.system, str):
+            job_args.system = job_args.system.split()
+        if isinstance(job_args.talkgroup_formats, str):
+            job_args.talkgroup_formats = job_args.talkgroup_formats.split()
+        check_choices(job_args, f"Job {name}")
+        jobs.append(tr_job(job_args, name))
+
+    if not jobs:
+        raise ValueError(f"No jobs in {path}")
+    if len({job.name for job in jobs}) != len(jobs):
+        raise ValueError(f"Job names in {path} must be unique")
+    return jobs
+
+
+def jobs_api(args, CACHE, PROFILE=None):
+    """
+    The rr_api every job of a run shares, pooled for every job and system fetching at once
+    and scheduled by the --rr_* options
+    """
+    scheduler = rr_scheduler(
+        rate=args.rr_rate,
+        timeout=args.rr_timeout,
+        retries=args.rr_retries,
+        concurrency=args.rr_concurrency,
+        slow_call=args.rr_slow_call,
+        profile=PROFILE
+    )
+    return rr_api(
+        args.username or "",
+        args.password or "",
+        # The scheduler keeps at most rr_concurrency calls in flight however many threads fetch
+        pool_size=max(args.rr_concurrency, 1),
+        wsdl=args.wsdl,
+        cache_dir=CACHE.cache_dir,
+        record_dir=args.record,
+        replay_dir=args.replay,
+        profile=PROFILE,
+        scheduler=scheduler
+    )
+
+
+def run_jobs(jobs, args, CACHE, PROFILE=None, API=None, TAGS=None):
+    """
+    Run a batch of tr_jobs: every job is fetched at once, planning is spread
+    over a process pool and configs are written as their plans come back
+
+    Returns the per job summary, PROFILE (a perf_profile) gets the SOAP calls
+    and the fetch / plan / write times of every job. Pass API (jobs_api) and
+    TAGS to keep the client and tag memo between batches
+    """
+    PROFILE = PROFILE if PROFILE else NO_PROFILE
+    RR_USER = args.username or ""
+    RR_PASS = args.password or ""
+    if TAGS is None:
+        TAGS = {}
+    if API is None:
+        API = jobs_api(args, CACHE, PROFILE)
+    # Jobs writing to the same directory share its manifest
+    manifests = {}
+    for job in jobs:
+        if job.args.output_dir not in manifests:
+            manifests[job.args.output_dir] = output_manifest(job.args.output_dir, force=job.args.force)
+
+    summary = {
+        job.name: {"systems": len(job.systems), "status": "ok", "configs": 0, "skipped": 0, "changed": [], "fetch_s": 0.0, "plan_s": 0.0, "write_s": 0.0}
+        for job in jobs
+    }
+
+    def fetch_job(job):
+        return timed(
+            fetchSystemData,
+            job.systems,
+            job.args.talkgroups,
+            RR_USER,
+            RR_PASS,
+            job.args.use_rr_site_id,
+            CACHE,
+            job.args.workers,
+            args.wsdl,
+            args.record,
+            args.replay,
+            summary[job.name]["changed"],
+            API,
+            TAGS,
+            job.args.talkgroup_formats,
+            None,
+            job.args.talkgroup_partitions
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as fetchers, ProcessPoolExecutor(max_workers=args.job_workers) as planners:
+        fetches = {fetchers.submit(fetch_job, job): job for job in jobs}
+        plans = {}
+        for future in as_completed(fetches):
+            job = fetches[future]
+            try:
+                system_results, summary[job.name]["fetch_s"] = future.result()
+            except Exception as e:
+                logging.critical(f"[!] Job {job.name} failed to fetch - {e}")
+                summary[job.name]["status"] = f"fetch failed: {e}"
+                continue
+
+            manifest = manifests[job.args.output_dir]
+            for name, group in job.groups(system_results):
+                inputs = manifest.inputs_hash(group, job.settings)
+                if manifest.unchanged(name, inputs) and not (job.args.print or job.args.print_radio_spacing):
+                    logging.info(f"[+] {name} is unchanged, skipping")
+                    summary[job.name]["skipped"] += 1
+                    continue
+                plans[planners.submit(timed, plan_group, name, group, job)] = (job, name, inputs)
+
+        for future in as_completed(plans):
+            job, name, inputs = plans[future]
+            try:
+                (configs, result), seconds = future.result()
+            except Exception as e:
+                logging.critical(f"[!] Job {job.name} failed to plan {name} - {e}")
+                summary[job.name]["status"] = f"plan failed: {e}"
+                continue
+            summary[job.name]["plan_s"] += seconds
+            PROFILE.add("plan", seconds)
+            if job.args.print_radio_spacing:
+                print(json.dumps(result, indent=4))
+
+            changed, seconds = timed(write_configs, name, inputs, configs, job, manifests[job.args.output_dir])
+            summary[job.name]["write_s"] += seconds
+            PROFILE.add("write", seconds)
+            summary[job.name]["configs"] += len(configs)
+            summary[job.name]["changed"].extend(changed)
+
+    for manifest in manifests.values():
+        manifest.save()
+    for job_summary in summary.values():
+        for timing in ["fetch_s", "plan_s", "write_s"]:
+            job_summary[timing] = round(job_summary[timing], 3)
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'job':<24}{'systems':>8}{'configs':>8}{'skipped':>8}{'changed':>8}{'fetch s':>10}{'plan s':>10}{'write s':>10}  status")
+    for name, job in summary.items():
+        print(f"{name:<24}{job['systems']:>8}{job['configs']:>8}{job['skipped']:>8}{len(job['changed']):>8}{job['fetch_s']:>10.3f}{job['plan_s']:>10.3f}{job['write_s']:>10.3f}  {job['status']}")
+
+def log_rr_outcomes(scheduler):
+    """
+    One line of how the Radio Reference calls of a run went, a warning when any had to be retried
+    """
+    outcomes = scheduler.summary()
+    if outcomes["ok"] or outcomes["retried"] or outcomes["failed"]:
+        level = logging.WARNING if outcomes["retried"] or outcomes["failed"] else logging.INFO
+        logging.log(level, f"[+] Radio Reference calls - {outcomes['ok']} ok, {outcomes['retried']} retried, {outcomes['failed']} failed, {outcomes['timeouts']} timed out, {outcomes['throttled_s']}s waited on the rate limit, {outcomes['limit']} at once")
+
+
+def parse_cache_ttls(pairs):
+    """
+    {method: seconds} of "getTrsSites=3600" pairs
+    """
+    return {method: int(ttl) for method, ttl in (pair.split("=") for pair in pairs)}
+
+
+def run_reload_hook(command, changed):
+    """
+    Run the --reload_hook shell command, the changed files are in TR_CHANGED_FILES one per line
+    """
+    logging.warning(f"[+] Running reload hook - {command}")
+    try:
+        hook = subprocess.run(
+            command,
+            shell=True,
+            env={**os.environ, "TR_CHANGED_FILES": "\n".join(changed)},
+            timeout=RELOAD_HOOK_TIMEOUT
+        )
+    except subprocess.TimeoutExpired:
+        logging.critical(f"[!] Reload hook took over {RELOAD_HOOK_TIMEOUT}s and was killed")
+        return False
+    if hook.returncode:
+        logging.critical(f"[!] Reload hook exited {hook.returncode}")
+    return hook.returncode == 0
+
+
+def watch(args, CACHE, PROFILE):
+    """
+    Keep running, polling every job about each --watch seconds
+
+    The SOAP client and tag memo live as long as the process. Each poll
+    fetches the sites again (getTrsSites is never served from the cache unless
+    --cache_ttl says so, the other methods keep their TTLs), re-plans and
+    rewrites only the configs the output manifest sees changed, and runs
+    --reload_hook when any file changed. The --jobs file is reloaded when it
+    changes. SIGHUP reloads it and polls every job now, SIGTERM / SIGINT stop
+    after the poll that is running
+    """
+    def load():
+        if args.jobs:
+            return load_jobs(args.jobs, args)
+        return [tr_job(args)]
+
+    def jobs_mtime():
+        try:
+            return os.path.getmtime(args.jobs) if args.jobs else None
+        except OSError:
+            return None
+
+    jobs = load()
+    loaded_mtime = jobs_mtime()
+    API = jobs_api(args, CACHE, PROFILE)
+    TAGS = {}
+    jitter = random.Random()
+    due = {job.name: 0.0 for job in jobs}
+
+    wake = threading.Event()
+    stop = threading.Event()
+    reload = threading.Event()
+    def on_stop(signum, frame):
+        stop.set()
+        wake.set()
+    def on_reload(signum, frame):
+        reload.set()
+        wake.set()
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, on_reload)
+
+    logging.warning(f"[+] Watching {len(jobs)} jobs every {args.watch}s")
+    while not stop.is_set():
+        if reload.is_set() or jobs_mtime() != loaded_mtime:
+            try:
+                reloaded = load()
+            except (OSError, ValueError, KeyError) as e:
+                logging.critical(f"[!] Keeping the running jobs, reloading them failed - {e}")
+            else:
+                # A forced reload polls everything now, a changed file only its new jobs
+                due = {job.name: 0.0 if reload.is_set() else due.get(job.name, 0.0) for job in reloaded}
+                jobs = reloaded
+                logging.warning(f"[+] Reloaded {len(jobs)} jobs")
+            loaded_mtime = jobs_mtime()
+            reload.clear()
+
+        now = time.monotonic()
+        ready = [job for job in jobs if due[job.name] <= now]
+        if ready:
+            try:
+                summary = run_jobs(ready, args, CACHE, PROFILE, API, TAGS)
+            except OSError as e:
+                # A full disk or an unwritable output dir may clear up, keep the daemon alive
+                logging.critical(f"[!] Poll failed - {e}")
+                summary = {job.name: {"status": f"poll failed: {e}", "changed": []} for job in ready}
+            for job in ready:
+                due[job.name] = time.monotonic() + args.watch * jitter.uniform(1 - args.watch_jitter, 1 + args.watch_jitter)
+                # --force only applies to the first poll
+                job.args.force = False
+                status = summary[job.name]
+                if status["status"] != "ok":
+                    logging.critical(f"[!] {job.name} - {status['status']}, trying again next poll")
+                elif status["changed"]:
+                    logging.warning(f"[+] {job.name} changed - {', '.join(status['changed'])}")
+                else:
+                    logging.info(f"[+] {job.name} unchanged")
+            args.force = False
+
+            changed = [filename for status in summary.values() for filename in status["changed"]]
+            if changed and args.reload_hook:
+                run_reload_hook(args.reload_hook, changed)
+
+        wake.wait(max(0.0, min(due.values()) - time.monotonic()))
+        wake.clear()
+    logging.warning("[+] Stopped watching")
+
+
+def build_parser(description='Generate TR config with RR data'):
+    """
+    The command line options, tr_service.py serves with the same ones
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-s','--system', nargs='+', help='List of Systems : site pairs "SystemID:siteID,siteID"')
     parser.add_argument('-r','--use_rr_site_id', help='Use RR DB **site** ids', action='store_true')
-    parser.add_argument('-u','--username', help='Radio Reference Username', required=True)
-    parser.add_argument('-p','--password', help='Radio Reference Password', required=True)
+    parser.add_argument('-u','--username', help='Radio Reference Username')
+    parser.add_argument('-p','--password', help='Radio Reference Password')
     parser.add_argument('-o','--output_dir', help='The directory to place the configs', default='')
     parser.add_argument('-t','--talkgroups', help='Generate talkgroups file for system', action='store_true')
+    parser.add_argument('-tf','--talkgroup_formats', nargs='+', help='Talkgroup files to write with --talkgroups, in one pass', choices=list(TALKGROUP_FORMATS), default=['csv'])
+    parser.add_argument('-tp','--talkgroup_partitions', help='Download talkgroups one category at a time, this many at once, for systems too large for one call', type=int)
     parser.add_argument('-m','--merge', help='Merge systems into one config', action='store_true')
     parser.add_argument('-l','--loglevel', help='Set log level [debug, info, warning]', default='warning')
     parser.add_argument('-P','--print', help='Print generated config(s) out', action='store_true')
@@ -397,9 +2714,53 @@ def startup():
     parser.add_argument('-sm','--sdr_max_sample_rate', help='The max sample rate of the SDRs in MHz')
     parser.add_argument('-sf','--sdr_fixed_sample_rate', help='Fix the sample rate of the SDRs in MHz')
     parser.add_argument('-sb','--spectrum_bandwidth', help='The badwith of the channels in Khz', default='12.5')    
+    parser.add_argument('-pl','--planner', help='How to split channels between SDRs, "optimal" minimizes SDRs then total sample rate', choices=PLANNERS, default='greedy')
+    parser.add_argument('-S','--sweep', help='Print the Pareto front of SDRs / throughput / edge margin over a grid of sample rates and bandwidths instead of writing configs', action='store_true')
+    parser.add_argument('-ss','--sweep_sample_rates', nargs='+', help='Max sample rates in MHz for --sweep', type=float, default=SDR_BANDWIDTH_OPTIONS)
+    parser.add_argument('-sw','--sweep_spectrum_bandwidths', nargs='+', help='Channel bandwidths in Khz for --sweep, defaults to --spectrum_bandwidth', type=float)
+    # Capacity
+    parser.add_argument('-mr','--max_recorders', help='Most digital recorders per source', type=int)
+    parser.add_argument('-hc','--host_cpu', help='CPU budget of the host in percent of one core (400 = 4 cores)', type=float)
+    parser.add_argument('-cm','--cpu_per_msps', help='Percent of one core trunk-recorder uses per Msps of a source', type=float, default=CPU_PER_MSPS)
+    parser.add_argument('-cr','--cpu_per_recorder', help='Percent of one core trunk-recorder uses per active recorder', type=float, default=CPU_PER_RECORDER)
+    parser.add_argument('-cl','--call_log', help='CSV of calls (freq, start_time, stop_time) to size recorders from')
+    parser.add_argument('-rh','--recorder_headroom', help='Recorders per concurrent call seen in --call_log', type=float, default=RECORDER_HEADROOM)
+    parser.add_argument('-so','--site_subset', help='Plan the fewest sites (and SDRs) that keep every system, the --keep_sites and the --call_log frequencies', action='store_true')
+    parser.add_argument('-ks','--keep_sites', nargs='+', help='Sites --site_subset always keeps')
+    parser.add_argument('-H','--hosts', help='JSON inventory of hosts and USB buses, writes one config per host')
+    parser.add_argument('-si','--sdr_inventory', help='JSON inventory of the SDRs at hand and their sample rates, plans every source on one of them')
     parser.add_argument('-rs','--print_radio_spacing', help='Print radio spacing config out', action='store_true')
     parser.add_argument('-rf','--random_file_name', help='Append UUID to the filename', action='store_true')
-    
+    parser.add_argument('-F','--force', help='Re-plan and rewrite every config even if its Radio Reference data is unchanged', action='store_true')
+    # Radio Reference cache
+    parser.add_argument('-cd','--cache_dir', help='Directory to cache Radio Reference responses in', default=CACHE_DIR)
+    parser.add_argument('-ct','--cache_ttl', nargs='+', help='Cache lifetime per SOAP method "getTrsSites=3600"', default=[])
+    parser.add_argument('-R','--refresh', help='Ignore cached Radio Reference data and fetch it again', action='store_true')
+    parser.add_argument('-O','--offline', help='Only use cached Radio Reference data', action='store_true')
+    parser.add_argument('-W','--wsdl', help='Local copy of the Radio Reference v15 WSDL', default=RR_WSDL)
+    parser.add_argument('-w','--workers', help='Systems to fetch from Radio Reference at once, --rr_concurrency limits the calls in flight', type=int, default=FETCH_WORKERS)
+    parser.add_argument('-rr','--rr_rate', help='Most Radio Reference calls per second, 0 for no limit', type=float, default=RR_RATE)
+    parser.add_argument('-rt','--rr_timeout', help='Seconds before a Radio Reference call times out', type=float, default=RR_TIMEOUT)
+    parser.add_argument('-ry','--rr_retries', help='Retries of a Radio Reference call that timed out or failed transiently', type=int, default=RR_RETRIES)
+    parser.add_argument('-rc','--rr_concurrency', help='Most Radio Reference calls in flight, fewer are used while it is slow or failing', type=int, default=RR_CONCURRENCY)
+    parser.add_argument('-rsc','--rr_slow_call', help='Seconds a Radio Reference call may take before fewer are sent at once', type=float, default=RR_SLOW_CALL)
+    parser.add_argument('-rec','--record', help='Save every Radio Reference response to this fixture directory')
+    parser.add_argument('-rep','--replay', help='Answer Radio Reference calls from a --record fixture directory instead of the API')
+    # Batch
+    parser.add_argument('-J','--jobs', help='JSON or YAML file of jobs (systems and their settings) to run instead of --system')
+    parser.add_argument('-jw','--job_workers', help='Processes to plan --jobs with, defaults to one per CPU', type=int)
+    parser.add_argument('-js','--summary', help='Write the per job summary of --jobs to this JSON file')
+    # Daemon
+    parser.add_argument('-wa','--watch', help='Keep running and poll Radio Reference for changes about every this many seconds', type=float)
+    parser.add_argument('-wj','--watch_jitter', help='Fraction --watch polls are randomly spread by', type=float, default=WATCH_JITTER)
+    parser.add_argument('-rl','--reload_hook', help='Shell command run after --watch changed files, they are listed in $TR_CHANGED_FILES')
+    # Profiling
+    parser.add_argument('-pf','--profile', help='Write phase timings and per SOAP method call counts, latency histograms and bytes to this JSON file')
+    parser.add_argument('-ps','--profile_stats', help='Write a cProfile dump of the run to this file (the --jobs planning processes are not included)')
+    return parser
+
+def startup():
+    parser = build_parser()
 
     print(
         f"""
@@ -426,186 +2787,158 @@ def main():
         logging.basicConfig(level=logging.INFO)
     else:
         logging.basicConfig(level=logging.WARNING)
-    
-    if args.sdr_max_sample_rate and args.sdr_fixed_sample_rate:
-        logging.critical("[!] You can only use '--sdr_max_sample_rate' or '--sdr_fixed_sample_rate' ")
+
+    PROFILE = perf_profile(enabled=bool(args.profile))
+    PROFILER = None
+    if args.profile_stats:
+        import cProfile
+        PROFILER = cProfile.Profile()
+        PROFILER.enable()
+    # Failed runs are often the slow ones, write the reports whichever way the run ends
+    try:
+        with PROFILE.phase("total"):
+            run(args, PROFILE)
+    finally:
+        if PROFILER:
+            PROFILER.disable()
+            PROFILER.dump_stats(args.profile_stats)
+            logging.warning(f"[+] Wrote cProfile stats - {args.profile_stats}")
+        if args.profile:
+            PROFILE.save(args.profile)
+
+def run(args, PROFILE):
+    """
+    One configurator run of the parsed command line, timed into PROFILE
+    """
+    if bool(args.system) == bool(args.jobs):
+        logging.critical("[!] Use either '--system' or '--jobs'")
         exit()
 
-    TR = tr_autotune()
+    if args.record and args.replay:
+        logging.critical("[!] You can only use '--record' or '--replay' ")
+        exit()
 
-    OUTPUT_DIR = args.output_dir
-    SPECTRTUM_BANDWIDTH = args.spectrum_bandwidth
+    if not (args.offline or args.replay) and not (args.username and args.password):
+        logging.critical("[!] '--username' and '--password' are required unless running '--offline' or '--replay'")
+        exit()
 
-    RR_USER = args.username
-    RR_PASS = args.password
+    try:
+        CACHE_TTL = parse_cache_ttls(args.cache_ttl)
+    except ValueError:
+        logging.critical("[!] Cache TTLs must be in '--cache_ttl <METHOD>=<SECONDS>' notation")
+        exit()
+    if args.watch:
+        # Site and frequency changes are what a watch is for, always ask RR for them
+        CACHE_TTL.setdefault("getTrsSites", 0)
+    CACHE = rr_cache(args.cache_dir, CACHE_TTL, refresh=args.refresh, offline=args.offline)
+
+    if args.watch:
+        if args.watch <= 0 or not 0 <= args.watch_jitter < 1:
+            logging.critical("[!] '--watch' must be above 0 and '--watch_jitter' between 0 and 1")
+            exit()
+        try:
+            watch(args, CACHE, PROFILE)
+        except (OSError, ValueError, KeyError) as e:
+            logging.critical(f"[!] {e}")
+            exit()
+        return
+
+    if args.jobs:
+        try:
+            JOBS = load_jobs(args.jobs, args)
+        except (OSError, ValueError, KeyError) as e:
+            logging.critical(f"[!] {e}")
+            exit()
+        API = jobs_api(args, CACHE, PROFILE)
+        SUMMARY = run_jobs(JOBS, args, CACHE, PROFILE, API)
+        log_rr_outcomes(API.scheduler)
+        print_summary(SUMMARY)
+        if args.summary:
+            with open(args.summary, 'w') as f:
+                json.dump(SUMMARY, f, indent=4)
+        logging.warning("[+] TR CONFIGURATOR HAS FINISHED")
+        if any(job["status"] != "ok" for job in SUMMARY.values()):
+            exit(1)
+        return
 
-    DOWNLOAD_TALKGROUPS = args.talkgroups
-    USE_RR_SITE_ID = args.use_rr_site_id
-    PRINT_RADIO_SPACING = args.print_radio_spacing
-    PRINT_DATA = args.print
-    RANDOM_FILE_NAME = args.random_file_name
-    MERGE_SITES = args.merge
+    try:
+        JOB = tr_job(args)
+    except ValueError as e:
+        logging.critical(f"[!] {e}")
+        exit()
 
-    SAMPLE_RATE = 3.2
-    FIXED_SAMPLE_RATE = None
-    if args.sdr_fixed_sample_rate:
-        FIXED_SAMPLE_RATE = float(args.sdr_fixed_sample_rate)
-        SAMPLE_RATE =  FIXED_SAMPLE_RATE
+    TR = tr_autotune(PROFILE)
+    MANIFEST = output_manifest(args.output_dir, force=args.force)
+    API = jobs_api(args, CACHE, PROFILE)
 
-    if args.sdr_max_sample_rate:
-        SAMPLE_RATE = float(args.sdr_max_sample_rate)
-        
-    try:
-        SYSTEMS = []
-        for system_pair in args.system:
-            data = {
-                "system_id": system_pair.split(":")[0],
-                "sites": system_pair.split(":")[1].split(",")
-            }
-            SYSTEMS.append(data)
-    except:
-        logging.critical("[!] Systems must be in '--system <SYSTEM ID>:<SITE ID>,<SITE ID> <SYSTEM ID>:<SITE ID>' notation")
+    # Replayed calls are matched without authInfo but zeep still wants one to build the request
+    RR_USER = args.username or ""
+    RR_PASS = args.password or ""
 
     try:
         SYSTEM_RESULTS = fetchSystemData(
-            SYSTEMS,
-            DOWNLOAD_TALKGROUPS,
+            JOB.systems,
+            args.talkgroups,
             RR_USER,
             RR_PASS,
-            USE_RR_SITE_ID
+            args.use_rr_site_id,
+            CACHE,
+            args.workers,
+            args.wsdl,
+            args.record,
+            args.replay,
+            MANIFEST.changed,
+            API,
+            FORMATS=args.talkgroup_formats,
+            PARTITIONS=args.talkgroup_partitions
         )
-    except exceptions.Fault:
-        logging.critical("[!] Invalid Radio Reference Username or Password")
-
-    if MERGE_SITES:
-        systems = []
-        main_freq_list = []
-        for system in SYSTEM_RESULTS:          
-            for site in system["sites"]:
-                system_json = deepcopy(trunk_recorder_helper.system_template)
-                
-                main_freq_list.extend(site["freqs"])
-        
-                site_type = system_types[system["system_type"]]
-                if site_type == "p25":
-                    modulation = "qpsk"
-                    if not site["modulation"] == "CPQSK":
-                        modulation = "fsk4"
-                    else:
-                        modulation = "qpsk"
-                else:
-                    modulation = "fsk4"
-
-                system_json["type"] = site_type
-                system_json["rrsysid"] = system["system_id"]            
-                system_json["rrsiteid"]= str(site["rr_site_id"])   
-                system_json["modulation"] = modulation
-                system_json["control_channels"].extend(site["control_channels"])
-                systems.append(system_json)
-
-        result = TR.find_freqs(main_freq_list, SAMPLE_RATE, SPECTRTUM_BANDWIDTH)
-        if PRINT_RADIO_SPACING:            
+    except RRFault as e:
+        # RR answers bad credentials and unknown systems alike with a fault
+        logging.critical(f"[!] Radio Reference refused the request, check the username, password and system IDs - {e}")
+        exit(1)
+    except RRUnavailable as e:
+        logging.critical(f"[!] Radio Reference is unavailable - {e}")
+        exit(1)
+    except ValueError as e:
+        logging.critical(f"[!] {e}")
+        exit()
+    log_rr_outcomes(API.scheduler)
+
+    groups = JOB.groups(SYSTEM_RESULTS)
+
+    if args.sweep:
+        report = {}
+        for name, group in groups:
+            with PROFILE.phase("sweep"):
+                report[name] = TR.sweep_channels(group_channels(group), args.sweep_sample_rates, args.sweep_spectrum_bandwidths or [args.spectrum_bandwidth])
+        print(json.dumps(report, indent=4))
+        logging.warning("[+] TR CONFIGURATOR HAS FINISHED")
+        return
+
+    for name, group in groups:
+        inputs = MANIFEST.inputs_hash(group, JOB.settings)
+        if MANIFEST.unchanged(name, inputs) and not (args.print or args.print_radio_spacing):
+            logging.warning(f"[+] {name} is unchanged, skipping")
+            continue
+
+        try:
+            with PROFILE.phase("plan"):
+                configs, result = plan_group(name, group, JOB, PROFILE)
+        except ValueError as e:
+            logging.critical(f"[!] {e}")
+            exit()
+
+        if args.print_radio_spacing:
             print(json.dumps(result, indent=4))
 
-        sources = []
-        for radio_index in result["results"]:
-            payload = deepcopy(trunk_recorder_helper.source_template)
-
-            payload["center"] = result["results"][radio_index]["center"]
-            if FIXED_SAMPLE_RATE:
-                payload["rate"] = int(TR.up_convert(FIXED_SAMPLE_RATE, TR.multipliers.mhz))
-            else:
-                payload["rate"] = int(result["results"][radio_index]["sample_rate"])
-            payload["device"] = f"rtl={str(radio_index-1)}"
-            payload["digitalRecorders"] = result["results"][radio_index]["channels"]
+        with PROFILE.phase("write"):
+            write_configs(name, inputs, configs, JOB, MANIFEST)
 
-            sources.append(payload)
-
-        config = deepcopy(trunk_recorder_helper.base)
-        config["systems"].extend(systems) 
-        config["sources"].extend(sources) 
-
-        system_id_string = ".".join([system["system_id"] for system in SYSTEMS])
-        if OUTPUT_DIR:
-            filename = f"{OUTPUT_DIR}/{system_id_string}.merged.config.json"            
-        else:
-            filename = f"{system_id_string}.merged.config.json"
-
-        if RANDOM_FILE_NAME:
-            filename = filename.strip('.json') + '.' + str(uuid.uuid4()) + '.json'
-
-        with open(filename, 'w') as f:
-            json.dump(config, f, indent=4)
-        logging.warning(f"[+] Wrote config - {filename}")
-
-        if PRINT_DATA:
-            print(json.dumps(config, indent=4))
-                
-        
+    MANIFEST.save()
+    if MANIFEST.changed:
+        logging.warning(f"[+] Changed files - {', '.join(MANIFEST.changed)}")
     else:
-        for system in SYSTEM_RESULTS:
-            systems = []
-            main_freq_list = []
-            
-
-            for site in system["sites"]:
-                system_json = deepcopy(trunk_recorder_helper.system_template)
-                
-                main_freq_list.extend(site["freqs"])                
-                
-                site_type = system_types[system["system_type"]]
-                if site_type == "p25":
-                    modulation = "qpsk"
-                    if not site["modulation"] == "CPQSK":
-                        modulation = "fsk4"
-                    else:
-                        modulation = "qpsk"
-                else:
-                    modulation = "fsk4"
-
-                system_json["type"] = site_type
-                system_json["rrsysid"] = system["system_id"]            
-                system_json["rrsiteid"] = str(site["rr_site_id"])
-                system_json["modulation"] = modulation
-                system_json["control_channels"].extend(site["control_channels"])
-                systems.append(system_json)
-
-            result = TR.find_freqs(main_freq_list, SAMPLE_RATE, SPECTRTUM_BANDWIDTH)
-            if PRINT_RADIO_SPACING:
-                print(json.dumps(result, indent=4))
-
-            sources = []
-            for radio_index in result["results"]:
-                payload = deepcopy(trunk_recorder_helper.source_template)
-
-                payload["center"] = result["results"][radio_index]["center"]
-                if FIXED_SAMPLE_RATE:
-                    payload["rate"] = int(TR.up_convert(FIXED_SAMPLE_RATE, TR.multipliers.mhz))
-                else:
-                    payload["rate"] = int(result["results"][radio_index]["sample_rate"])
-                payload["device"] = f"rtl={str(radio_index-1)}"
-                payload["digitalRecorders"] = result["results"][radio_index]["channels"]
-
-                sources.append(payload)
-
-            config = deepcopy(trunk_recorder_helper.base)
-            config["systems"].extend(systems) 
-            config["sources"].extend(sources) 
-
-            if OUTPUT_DIR:
-                filename = f"{OUTPUT_DIR}/{system['system_id']}.config.json"            
-            else:
-                filename = f"{system['system_id']}.config.json"
-            if RANDOM_FILE_NAME:
-                filename = filename.strip('.json') + '.' + str(uuid.uuid4()) + '.json'
-
-            with open(filename, 'w') as f:
-                json.dump(config, f, indent=4)
-            logging.warning(f"[+] Wrote config - {filename}")
-
-            if PRINT_DATA:
-                print(json.dumps(config, indent=4))
-                
+        logging.warning("[+] No files changed")
     logging.warning("[+] TR CONFIGURATOR HAS FINISHED")
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""
+Record and replay Radio Reference SOAP exchanges
+
+RecordingTransport saves every response the live API gives to a fixture
+directory, ReplayTransport answers from that directory without touching the
+network and rr_server.py serves it over HTTP. Requests are matched on the SOAP
+method and its arguments, the authInfo credentials are never part of a key or
+written to disk.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+from xml.etree import ElementTree
+
+import requests
+from zeep import Transport
+
+SOAP_ENV = "{http://schemas.xmlsoap.org/soap/envelope/}"
+# The recorded v15 WSDL, served by rr_server.py
+WSDL_FIXTURE = "wsdl.xml"
+
+
+def local_name(tag):
+    return tag.split("}")[-1]
+
+
+def fixture_key(message):
+    """
+    (method, key) of a SOAP request body, the key hashes every argument except authInfo
+    """
+    call = ElementTree.fromstring(message).find(f"{SOAP_ENV}Body")[0]
+    method = local_name(call.tag)
+    args = [(local_name(arg.tag), (arg.text or "").strip()) for arg in call if local_name(arg.tag) != "authInfo"]
+    return method, hashlib.sha1(json.dumps([method, args]).encode()).hexdigest()
+
+
+def fixture_path(fixture_dir, method, key):
+    return os.path.join(fixture_dir, f"{method}.{key}.xml")
+
+
+def load_path(fixture_dir, url):
+    """
+    Fixture for a document zeep loads (the WSDL and the schemas it imports)
+    """
+    return os.path.join(fixture_dir, f"load.{hashlib.sha1(url.encode()).hexdigest()}.xml")
+
+
+def write_fixture(path, content):
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+class RecordingTransport(Transport):
+    """
+    zeep Transport that saves every successful exchange to fixture_dir
+    """
+    def __init__(self, fixture_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def load(self, url):
+        content = super().load(url)
+        if url.startswith(("http://", "https://")):
+            write_fixture(load_path(self.fixture_dir, url), content)
+        if "wsdl" in url.lower():
+            write_fixture(os.path.join(self.fixture_dir, WSDL_FIXTURE), content)
+        return content
+
+    def post(self, address, message, headers):
+        response = super().post(address, message, headers)
+        if response.status_code == 200:
+            method, key = fixture_key(message)
+            write_fixture(fixture_path(self.fixture_dir, method, key), response.content)
+            logging.debug(f"[+] Recorded {method} - {key}")
+        return response
+
+
+class ReplayTransport(Transport):
+    """
+    zeep Transport answering from a RecordingTransport fixture_dir, never touches the network
+    """
+    def __init__(self, fixture_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.fixture_dir = fixture_dir
+
+    def load(self, url):
+        if not url.startswith(("http://", "https://")):
+            return super().load(url)
+        try:
+            with open(load_path(self.fixture_dir, url), 'rb') as f:
+                return f.read()
+        except OSError:
+            raise ValueError(f"No recorded copy of {url} in {self.fixture_dir}")
+
+    def post(self, address, message, headers):
+        method, key = fixture_key(message)
+        try:
+            with open(fixture_path(self.fixture_dir, method, key), 'rb') as f:
+                content = f.read()
+        except OSError:
+            raise ValueError(f"No recorded {method} response ({key}) in {self.fixture_dir}")
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = address
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "text/xml; charset=utf-8"
+        response._content = content
+        return response
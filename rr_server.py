@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+Stand-in Radio Reference SOAP server answering from a --record fixture directory
+
+    python3 main.py --system 6699:33559 -u USER -p PASS --record fixtures
+    python3 rr_server.py --fixtures fixtures --latency 150 --jitter 50 --error_rate 0.05
+
+--error_rate (bare 503 / 429 answers) and --drop_rate are transient, main.py retries them.
+--fault_rate answers with SOAP faults, which RR uses for bad credentials and unknown
+systems, so main.py gives up on them right away.
+    python3 main.py --system 6699:33559 -u x -p x --refresh --wsdl "http://127.0.0.1:8080/?wsdl"
+"""
+
+import argparse
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rr_fixtures import WSDL_FIXTURE, fixture_key, fixture_path
+
+FAULT = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><SOAP-ENV:Fault><faultcode>SOAP-ENV:Server</faultcode><faultstring>{}</faultstring></SOAP-ENV:Fault></SOAP-ENV:Body>
+</SOAP-ENV:Envelope>
+"""
+
+
+class rr_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status, content):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def misbehave(self):
+        """
+        Sleep for the configured latency, then maybe drop the connection, answer with
+        a bare 503 or 429 (no SOAP body, like an overloaded server or proxy) or with a fault
+        Returns True when the request has been dealt with
+        """
+        server = self.server
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if random.random() < server.drop_rate:
+            self.close_connection = True
+            return True
+        if random.random() < server.error_rate:
+            self.send_response(random.choice([503, 429]))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        if random.random() < server.fault_rate:
+            self.reply(500, FAULT.format("Injected fault").encode())
+            return True
+        return False
+
+    def do_GET(self):
+        """
+        The recorded WSDL, with its endpoint pointed back at this server
+        """
+        try:
+            with open(os.path.join(self.server.fixtures, WSDL_FIXTURE), 'rb') as f:
+                wsdl = f.read()
+        except OSError:
+            self.reply(404, b"No recorded WSDL")
+            return
+
+        address = f'location="http://{self.headers.get("Host", "127.0.0.1")}/"'.encode()
+        self.reply(200, re.sub(rb'location="[^"]*"', address, wsdl))
+
+    def do_POST(self):
+        message = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.misbehave():
+            return
+
+        method, key = fixture_key(message)
+        with self.server.lock:
+            self.server.calls[method] = self.server.calls.get(method, 0) + 1
+        try:
+            with open(fixture_path(self.server.fixtures, method, key), 'rb') as f:
+                self.reply(200, f.read())
+        except OSError:
+            logging.warning(f"[-] No fixture for {method} - {key}")
+            self.reply(500, FAULT.format(f"No fixture for {method}").encode())
+
+    def log_message(self, format, *args):
+        logging.info(f"[+] {self.address_string()} {format % args}")
+
+
+def startup():
+    parser = argparse.ArgumentParser(description='Serve recorded Radio Reference responses with injected latency and faults')
+    parser.add_argument('-f','--fixtures', help='Fixture directory written by main.py --record', required=True)
+    parser.add_argument('-b','--bind', help='Address to listen on', default='127.0.0.1')
+    parser.add_argument('-p','--port', help='Port to listen on', type=int, default=8080)
+    parser.add_argument('-L','--latency', help='Delay before every SOAP response in ms', type=float, default=0)
+    parser.add_argument('-j','--jitter', help='Random +/- spread on --latency in ms', type=float, default=0)
+    parser.add_argument('-fr','--fault_rate', help='Share of calls answered with a SOAP fault, which main.py does not retry', type=float, default=0)
+    parser.add_argument('-er','--error_rate', help='Share of calls answered with a bare 503 or 429, which main.py retries', type=float, default=0)
+    parser.add_argument('-dr','--drop_rate', help='Share of calls whose connection is closed without a response', type=float, default=0)
+    parser.add_argument('-l','--loglevel', help='Set log level [debug, info, warning]', default='warning')
+    return parser.parse_args()
+
+
+def serve():
+    args = startup()
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper(), logging.WARNING))
+
+    server = ThreadingHTTPServer((args.bind, args.port), rr_handler)
+    server.fixtures = args.fixtures
+    server.latency = args.latency / 1000
+    server.jitter = args.jitter / 1000
+    server.fault_rate = args.fault_rate
+    server.error_rate = args.error_rate
+    server.drop_rate = args.drop_rate
+    server.calls = {}
+    server.lock = threading.Lock()
+
+    logging.warning(f"[+] Serving {args.fixtures} on http://{args.bind}:{args.port}/?wsdl")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    logging.warning(f"[+] Calls served - {server.calls}")
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+"""
+Local HTTP planning service, previews SDR plans and configs without running main.py
+
+    python3 tr_service.py -u USER -p PASS -r --port 8081
+    curl -s localhost:8081/plan -d '{"system": ["6699:33559,17501"], "sdr_max_sample_rate": 2.4, "merge": true}'
+
+Takes every main.py option as the default of its requests, a request gives
+hosts and sdr_inventory inline as JSON objects rather than file paths. Fetched
+systems and plans are kept in memory (least recently used are dropped first),
+concurrent requests for the same system or plan share one fetch or planning run.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import main
+
+# Options a /plan request may set, by their long command line name
+SERVICE_OPTIONS = [
+    "system", "use_rr_site_id", "merge", "sdr_max_sample_rate", "sdr_fixed_sample_rate", "spectrum_bandwidth", "planner",
+    "max_recorders", "host_cpu", "cpu_per_msps", "cpu_per_recorder", "recorder_headroom", "hosts", "site_subset", "keep_sites", "sdr_inventory",
+]
+# Options that are file paths on the command line, a request gives their contents as a JSON object instead
+INLINE_OPTIONS = ["hosts", "sdr_inventory"]
+# Fetched systems and plans kept in memory (each)
+CACHE_ENTRIES = 256
+# How long (in seconds) a fetched system is served from memory before it is fetched (or read from the rr_cache) again
+DATA_TTL = 900
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+
+
+class lru_cache:
+    """
+    Least recently used map of computed values, concurrent misses of a key share one computation
+
+    Entries older than ttl seconds are computed again, failures are never kept
+    """
+    def __init__(self, size=CACHE_ENTRIES, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "evicted": 0}
+
+    async def get(self, key, compute):
+        """
+        The value of key, awaiting compute() (a coroutine function) when it is not cached
+        """
+        entry = self.entries.get(key)
+        if entry and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+        task = self.pending.get(key)
+        if task:
+            self.stats["shared"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(compute())
+            self.pending[key] = task
+            task.add_done_callback(lambda task: self._store(key, task))
+        # A client hanging up must not cancel the work others are waiting on
+        return await asyncio.shield(task)
+
+    def _store(self, key, task):
+        self.pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.entries[key] = (time.monotonic(), task.result())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def report(self):
+        return dict(self.stats, entries=len(self.entries))
+
+
+class planning_service:
+    """
+    JSON endpoints over fetchSystemData, plan_group and the config writers
+
+    GET /health, GET /stats and POST /plan with a body of SERVICE_OPTIONS
+    """
+    def __init__(self, args):
+        self.args = args
+        self.cache = main.rr_cache(args.cache_dir, main.parse_cache_ttls(args.cache_ttl), refresh=args.refresh, offline=args.offline)
+        self.profile = main.perf_profile()
+        self.api = main.jobs_api(args, self.cache, self.profile)
+        self.tags = {}
+        self.pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+        self.systems = lru_cache(args.cache_entries, args.data_ttl)
+        self.plans = lru_cache(args.cache_entries)
+
+    def job(self, body):
+        """
+        tr_job of a /plan body, unset options come from the service's command line
+        """
+        if not isinstance(body, dict):
+            raise ValueError("The body must be a JSON object")
+        unknown = [option for option in body if option not in SERVICE_OPTIONS]
+        if unknown:
+            raise ValueError(f"Unknown options {', '.join(unknown)}")
+        # Paths would let any caller open files on the service's host
+        for option in INLINE_OPTIONS:
+            if body.get(option) is not None and not isinstance(body[option], dict):
+                raise ValueError(f"{option} must be a JSON object, not a path")
+        job_args = argparse.Namespace(**{**vars(self.args), "call_log": None, **body})
+        if isinstance(job_args.system, str):
+            job_args.system = job_args.system.split()
+        if not job_args.system:
+            raise ValueError("No system to plan")
+        main.check_choices(job_args, "Option")
+        return main.tr_job(job_args)
+
+    async def fetch(self, system, use_rr_site_id):
+        """
+        The System of one {"system_id", "sites"}, fetched once however many requests want it
+        """
+        key = (system["system_id"], tuple(sorted(int(site) for site in system["sites"])), bool(use_rr_site_id))
+
+        async def compute():
+            loop = asyncio.get_running_loop()
+            with self.profile.phase("fetch"):
+                results = await loop.run_in_executor(
+                    self.pool,
+                    lambda: main.fetchSystemData(
+                        [system],
+                        False,
+                        self.args.username or "",
+                        self.args.password or "",
+                        use_rr_site_id,
+                        self.cache,
+                        1,
+                        API=self.api,
+                        TAGS=self.tags
+                    )
+                )
+            return results[0]
+        return await self.systems.get(key, compute)
+
+    async def plan(self, body):
+        start = time.perf_counter()
+        job = self.job(body)
+        system_results = await asyncio.gather(*(self.fetch(system, job.args.use_rr_site_id) for system in job.systems))
+
+        groups = {}
+        for name, group in job.groups(system_results):
+            async def compute(name=name, group=group):
+                loop = asyncio.get_running_loop()
+                with self.profile.phase("plan"):
+                    return await loop.run_in_executor(self.pool, main.plan_group, name, group, job)
+            configs, result = await self.plans.get((name, main.output_manifest.inputs_hash(group, job.settings)), compute)
+            groups[name] = {
+                "sdrs": len(result["results"]),
+                "throughput": int(sum(radio["sample_rate"] for radio in result["results"].values())),
+                "plan": result,
+                "configs": configs,
+            }
+        return {"groups": groups, "ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    async def route(self, method, path, body):
+        """
+        (status, payload) of one request
+        """
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {"status": "ok", "version": main.VERSION}
+        if path == "/stats" and method == "GET":
+            return HTTPStatus.OK, {"systems": self.systems.report(), "plans": self.plans.report(), "profile": self.profile.report()}
+        if path == "/plan" and method == "POST":
+            try:
+                return HTTPStatus.OK, await self.plan(json.loads(body or b"{}"))
+            except main.RRFault as e:
+                return HTTPStatus.BAD_GATEWAY, {"error": f"Radio Reference - {e}"}
+            except main.RRUnavailable as e:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}
+            except (ValueError, KeyError, TypeError) as e:
+                return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        if path in ("/health", "/stats", "/plan"):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} is not allowed on {path}"}
+        return HTTPStatus.NOT_FOUND, {"error": f"No endpoint {path}"}
+
+    async def handle(self, reader, writer):
+        """
+        HTTP/1.1 with keep-alive, one request at a time per connection
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if length > MAX_BODY:
+                    status, payload, keep_alive = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": f"Bodies are limited to {MAX_BODY} bytes"}, False
+                elif method == "OPTIONS":
+                    await reader.readexactly(length)
+                    status, payload = HTTPStatus.NO_CONTENT, None
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, payload = await self.route(method, path.split("?")[0], body)
+                    except Exception as e:
+                        logging.exception(f"[!] {method} {path} failed")
+                        status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+                content = json.dumps(payload).encode() if payload is not None else b""
+                response = [
+                    f"HTTP/1.1 {status.value} {status.phrase}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(content)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if self.args.cors_origin:
+                    response.append(f"Access-Control-Allow-Origin: {self.args.cors_origin}")
+                    response.append("Access-Control-Allow-Methods: GET, POST, OPTIONS")
+                    response.append("Access-Control-Allow-Headers: Content-Type")
+                writer.write(("\r\n".join(response) + "\r\n\r\n").encode() + content)
+                await writer.drain()
+                logging.info(f"[+] {method} {path} {status.value}")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def startup():
+    parser = main.build_parser('Serve SDR plans and trunk-recorder configs over HTTP, the main.py options are the defaults of every request')
+    parser.add_argument('-B','--bind', help='Address to listen on', default='127.0.0.1')
+    parser.add_argument('-bp','--port', help='Port to listen on', type=int, default=8081)
+    parser.add_argument('-ce','--cache_entries', help='Systems and plans kept in memory (each)', type=int, default=CACHE_ENTRIES)
+    parser.add_argument('-dt','--data_ttl', help='Seconds a fetched system is kept in memory', type=float, default=DATA_TTL)
+    parser.add_argument('-co','--cors_origin', help='Origin allowed to call the service from a browser, "*" for any')
+    return parser.parse_args()
+
+
+async def serve(args):
+    service = planning_service(args)
+    server = await asyncio.start_server(service.handle, args.bind, args.port)
+    logging.warning(f"[+] Serving plans on http://{args.bind}:{args.port}/plan")
+    async with server:
+        await server.serve_forever()
+
+
+def run():
+    args = startup()
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper(), logging.WARNING))
+    if not (args.offline or args.replay) and not (args.username and args.password):
+        logging.critical("[!] '--username' and '--password' are required unless running '--offline' or '--replay'")
+        exit()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run()